@@ -1,15 +1,21 @@
-import requests
+import asyncio
 import datetime
 import base64
+import time
 import uuid
-from no_authentication_endpoints import no_authentication_endpoints
+from concurrent.futures import ThreadPoolExecutor
+from no_authentication_endpoints import no_authentication_endpoints, run_coroutine
+from rate_limiter import PRIORITY_HIGH, PRIORITY_NORMAL
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.asymmetric import padding
 
 class authentication_endpoints(no_authentication_endpoints):
-    def __init__(self,api_key, file_path_to_private_key):
-        super().__init__()
+    def __init__(self,api_key, file_path_to_private_key, session=None, scheduler=None):
+        '''
+        scheduler is the request_scheduler whose read/write budgets and retries every call goes through
+        '''
+        super().__init__(session, scheduler=scheduler)
         self.API_KEY_ID = api_key
         self.PRIVATE_KEY_PATH = file_path_to_private_key  # Using raw string for Windows path
         self.BASE_URL = 'https://demo-api.kalshi.co'  # or 'https://api.kalshi.com' for production
@@ -33,21 +39,24 @@ class authentication_endpoints(no_authentication_endpoints):
         )
         return base64.b64encode(signature).decode('utf-8')
 
-    def get(self, private_key, api_key_id, path,base_url=None):
+    def get(self, private_key, api_key_id, path,base_url=None, priority:int=PRIORITY_NORMAL):
         """Make an authenticated GET request to the Kalshi API."""
         if(base_url==None):
             base_url=self.BASE_URL
-        timestamp = str(int(datetime.datetime.now().timestamp() * 1000))
-        signature = self.create_signature(private_key, timestamp, "GET", path)
 
-        headers = {
-            'KALSHI-ACCESS-KEY': api_key_id,
-            'KALSHI-ACCESS-SIGNATURE': signature,
-            'KALSHI-ACCESS-TIMESTAMP': timestamp
-        }
+        def send():#signed again on every retry so the timestamp stays fresh
+            timestamp = str(int(datetime.datetime.now().timestamp() * 1000))
+            signature = self.create_signature(private_key, timestamp, "GET", path)
+
+            headers = {
+                'KALSHI-ACCESS-KEY': api_key_id,
+                'KALSHI-ACCESS-SIGNATURE': signature,
+                'KALSHI-ACCESS-TIMESTAMP': timestamp
+            }
+            return self.session.get(base_url + path, headers=headers)
 
-        return requests.get(base_url + path, headers=headers)
-    def get_order_book(self, market_id):
+        return self.scheduler.send('read', send, priority)
+    def get_order_book(self, market_id, priority:int=PRIORITY_NORMAL):
         """
         The order book shows all active bid orders for both yes and no sides of a binary market.
         don't forget about the reciprical nature of the contracts: yes bid at 20 is used for same order of no ask at 80 
@@ -56,7 +65,7 @@ class authentication_endpoints(no_authentication_endpoints):
         if you index by no_dollars or yes_dollars format is in [dollars, contracts available]
         """
         
-        orderbook_response = self.get(self.private_key, self.API_KEY_ID, f"/trade-api/v2/markets/{market_id}/orderbook")
+        orderbook_response = self.get(self.private_key, self.API_KEY_ID, f"/trade-api/v2/markets/{market_id}/orderbook", priority=priority)
         orderbook_data = orderbook_response.json()
         return orderbook_data
 
@@ -84,21 +93,24 @@ class authentication_endpoints(no_authentication_endpoints):
         response = self.get(self.private_key, self.API_KEY_ID, "/trade-api/v2/portfolio/order_groups")
         return response.json()
         
-    def post(self,private_key, api_key_id, path, data, base_url=None):
+    def post(self,private_key, api_key_id, path, data, base_url=None, priority:int=PRIORITY_NORMAL):
         """Make an authenticated POST request to the Kalshi API."""
         if(base_url==None):
             base_url=self.BASE_URL
-        timestamp = str(int(datetime.datetime.now().timestamp() * 1000))
-        signature = self.create_signature(private_key, timestamp, "POST", path)
 
-        headers = {
-            'KALSHI-ACCESS-KEY': api_key_id,
-            'KALSHI-ACCESS-SIGNATURE': signature,
-            'KALSHI-ACCESS-TIMESTAMP': timestamp,
-            'Content-Type': 'application/json'
-        }
+        def send():#retrying an order is safe, its client_order_id makes the exchange drop duplicates
+            timestamp = str(int(datetime.datetime.now().timestamp() * 1000))
+            signature = self.create_signature(private_key, timestamp, "POST", path)
+
+            headers = {
+                'KALSHI-ACCESS-KEY': api_key_id,
+                'KALSHI-ACCESS-SIGNATURE': signature,
+                'KALSHI-ACCESS-TIMESTAMP': timestamp,
+                'Content-Type': 'application/json'
+            }
+            return self.session.post(base_url + path, headers=headers, json=data)
 
-        return requests.post(base_url + path, headers=headers, json=data)
+        return self.scheduler.send('write', send, priority)
     
     def place_limit_order(self,market_id:str, sell_or_buy:str, yes_or_no:str, contract_count:int,price:int):
         '''
@@ -113,30 +125,57 @@ class authentication_endpoints(no_authentication_endpoints):
             "yes_price": price,
             "client_order_id": str(uuid.uuid4())  # Unique ID for deduplication
         }
-        response = self.post(self.private_key, self.API_KEY_ID, '/trade-api/v2/portfolio/orders', order_data)
+        response = self.post(self.private_key, self.API_KEY_ID, '/trade-api/v2/portfolio/orders', order_data, priority=PRIORITY_HIGH)
         return response
     
-    def place_trades_given_portfolio_at_closest_bid(self, portfolio:dict):
+    def closest_bid_price(self, orderbook, yes_or_no:str)->int:#price that matches the best bid on the other side
+        if yes_or_no=='yes':
+            return 100 - int(orderbook['orderbook']['no'][-1][0])
+        elif yes_or_no=='no':
+            return 100 - int(orderbook['orderbook']['yes'][-1][0])
+        raise ValueError(f"yes_or_no must be 'yes' or 'no', got {yes_or_no!r}")
+
+    def place_order_at_closest_bid(self, market_ticker:str, yes_or_no:str, contract_count:int=1)->dict:
+        '''
+        fetches the order book, then buys at the closest bid; never raises, the outcome is in the returned dict:
+        market, side, price, status ('placed', 'rejected' or 'error'), http_status, order_id, error and latency in seconds
+        '''
+        result = {'market': market_ticker, 'side': yes_or_no, 'price': None, 'status': 'error', 'http_status': None,
+                  'order_id': None, 'error': None, 'latency': None}
+        start = time.perf_counter()
+        try:
+            result['price'] = self.closest_bid_price(self.get_order_book(market_ticker, PRIORITY_HIGH), yes_or_no)
+            response = self.place_limit_order(market_ticker, 'buy', yes_or_no, contract_count, result['price'])
+            result['http_status'] = response.status_code
+            body = response.json() if response.content else {}
+            if response.ok:
+                result['status'] = 'placed'
+                result['order_id'] = body.get('order', {}).get('order_id')
+            else:
+                result['status'] = 'rejected'
+                result['error'] = str(body.get('error', response.text))
+        except Exception as error:
+            result['error'] = repr(error)
+        result['latency'] = time.perf_counter() - start
+        return result
+
+    async def place_trades_given_portfolio_at_closest_bid_async(self, portfolio:dict, max_concurrency:int=16, contract_count:int=1)->list:
+        '''
+        every market of the portfolio at once, up to max_concurrency in flight and within the scheduler's budgets
+        each order (order book fetch, rsa-pss signing and post) runs on a worker thread so signing never blocks the loop
+        results come back in portfolio order
+        '''
+        orders = [(row[2], row[3] if len(row) > 3 else None) for sector in portfolio for row in portfolio[sector]]
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_concurrency) as pool:
+            placements = [loop.run_in_executor(pool, self.place_order_at_closest_bid, market_ticker, yes_or_no, contract_count)
+                          for market_ticker, yes_or_no in orders]
+            return await asyncio.gather(*placements)
+
+    def place_trades_given_portfolio_at_closest_bid(self, portfolio:dict, max_concurrency:int=16, contract_count:int=1)->list:
         '''
         portfolio is a dictionary that points to 2d array with each market as an array with its tickers/yes_or_no trade as another. order of ticker array is series, event, market
-        for example, yess/no  ' 'Politics': [['KXGOVSHUTLENGTH', 'KXGOVSHUTLENGTH-26JAN01','KXGOVSHUTLENGTH-26JAN01-38D'],['KXEPSTEINBILL','KXEPSTEINBILL-26JAN01', 'KXEPSTEINBILL-26JAN01']]
+        for example, yess/no  ' 'Politics': [['KXGOVSHUTLENGTH', 'KXGOVSHUTLENGTH-26JAN01','KXGOVSHUTLENGTH-26JAN01-38D', 'yes'],['KXEPSTEINBILL','KXEPSTEINBILL-26JAN01', 'KXEPSTEINBILL-26JAN01', 'no']]
+        orders go out concurrently, returns one result dict per market (see place_order_at_closest_bid)
         '''
-        for sector in portfolio.keys():
-            for market in range(len(portfolio[sector])):
-                market_ticker = portfolio[sector][market][2]
-                try:
-                    
-                    yes_or_no_trade  = portfolio[sector][market][3]
-                    orderbook  = self.get_order_book(market_ticker)
-                    
-                    closest_price = 0 
-                    if yes_or_no_trade=='yes':
-                        closest_price = 100 - int(orderbook['orderbook']['no'][-1][0])
-                    elif yes_or_no_trade=='no':
-                        closest_price = 100- int(orderbook['orderbook']['yes'][-1][0])
-                    print(closest_price)
-                    self.place_limit_order(market_ticker,'buy',yes_or_no_trade,1, closest_price)
-                except Exception:
-                    print(f'order_issue for {market_ticker}')
-            
-            
\ No newline at end of file
+        return run_coroutine(self.place_trades_given_portfolio_at_closest_bid_async(portfolio, max_concurrency, contract_count))
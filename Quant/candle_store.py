@@ -0,0 +1,65 @@
+import json
+import os
+import sqlite3
+from contextlib import closing
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'candles.sqlite')#next to this file, wherever it runs from
+
+class candle_store:
+    '''
+    on disk candlestick store (sqlite, one row per candle) keyed by series/market/period_interval/end_period_ts
+    candles are kept exactly as the api returns them, so anything that reads get_candle_sticks output can read these
+    '''
+    def __init__(self, path:str=DEFAULT_PATH):
+        self.path = path
+        with closing(self.connect()) as connection, connection:
+            connection.execute('PRAGMA journal_mode=WAL')#readers don't block the writer when many markets update at once
+            connection.execute('''CREATE TABLE IF NOT EXISTS candles (
+                series_id TEXT NOT NULL,
+                market_id TEXT NOT NULL,
+                period_interval INTEGER NOT NULL,
+                end_period_ts INTEGER NOT NULL,
+                candle TEXT NOT NULL,
+                PRIMARY KEY (series_id, market_id, period_interval, end_period_ts)
+            ) WITHOUT ROWID''')
+
+    def connect(self):#a connection per call so the store can be used from the concurrent fetch threads
+        return sqlite3.connect(self.path, timeout=30)
+
+    def last_end_ts(self, series_id, market_id, period_interval:int):
+        with closing(self.connect()) as connection:
+            row = connection.execute(
+                'SELECT MAX(end_period_ts) FROM candles WHERE series_id=? AND market_id=? AND period_interval=?',
+                (series_id, market_id, period_interval)).fetchone()
+        return row[0]
+
+    def add(self, series_id, market_id, period_interval:int, candles):#a candle that is already stored is replaced
+        rows = [(series_id, market_id, period_interval, candle['end_period_ts'], json.dumps(candle)) for candle in candles]
+        with closing(self.connect()) as connection, connection:
+            connection.executemany('INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def load(self, series_id, market_id, period_interval:int, start=None, end=None)->list:
+        '''
+        stored candles oldest first, start/end are optional unix times (inclusive) on end_period_ts
+        '''
+        query = 'SELECT candle FROM candles WHERE series_id=? AND market_id=? AND period_interval=?'
+        params = [series_id, market_id, period_interval]
+        if start is not None:
+            query += ' AND end_period_ts >= ?'
+            params.append(int(start))
+        if end is not None:
+            query += ' AND end_period_ts <= ?'
+            params.append(int(end))
+        with closing(self.connect()) as connection:
+            rows = connection.execute(query + ' ORDER BY end_period_ts', params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def delete(self, series_id, market_id, period_interval:int=None):
+        query = 'DELETE FROM candles WHERE series_id=? AND market_id=?'
+        params = [series_id, market_id]
+        if period_interval is not None:
+            query += ' AND period_interval=?'
+            params.append(period_interval)
+        with closing(self.connect()) as connection, connection:
+            connection.execute(query, params)
@@ -0,0 +1,33 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+class pooled_session(requests.Session):
+    '''
+    requests.Session with a connection pool big enough for many markets at once, keep-alive and gzip turned on
+    and a default timeout for every request that doesn't pass its own
+    timeout is seconds, or a (connect, read) tuple like requests takes
+    '''
+    def __init__(self, pool_size:int=32, timeout=(3.05, 30), keep_alive:bool=True, gzip:bool=True, max_retries:int=0):
+        super().__init__()
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=max_retries)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+        self.headers['Accept-Encoding'] = 'gzip, deflate' if gzip else 'identity'
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().request(method, url, **kwargs)
+
+
+shared = {'session': None}#one pool for every client in the process so they all reuse the same open connections
+
+def get_shared_session()->pooled_session:
+    if shared['session'] is None:
+        shared['session'] = pooled_session()
+    return shared['session']
+
+def set_shared_session(session):#e.g. a pooled_session with other settings, or one pointed at a test server
+    shared['session'] = session
@@ -0,0 +1,117 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class metadata_cache:
+    '''
+    cache for series/event/market metadata responses with a ttl per endpoint (seconds, None never expires),
+    lru eviction past maxsize and hit/miss counters per endpoint
+    with a path the entries are also written to a json file and loaded back the next time, so reruns start warm
+    the file is written every flush_every changes, on flush() and when the interpreter exits, never on every miss
+    '''
+    DEFAULT_TTLS = {
+        'series': 24 * 3600,
+        'event': 3600,
+        'market': 60,#market info carries live prices and status
+        'market_open_time': None,#never changes once the market exists
+    }
+
+    def __init__(self, ttls:dict=None, maxsize:int=10_000, path:str=None, flush_every:int=100):
+        self.ttls = dict(self.DEFAULT_TTLS, **(ttls or {}))
+        self.maxsize = maxsize
+        self.path = path
+        self.flush_every = flush_every
+        self.entries = OrderedDict()#(endpoint, key) -> (expires_at or None, value)
+        self.hits = {}
+        self.misses = {}
+        self.changes = 0#since the file was last written
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()#one writer at a time, without holding up the lookups
+        if path:
+            if os.path.exists(path):
+                self.load()
+            atexit.register(self.flush)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, endpoint:str, key, fetch):
+        '''
+        the cached value for (endpoint, key) if it hasn't expired, otherwise fetch() which is stored unless
+        it is an api error response
+        '''
+        cache_key = (endpoint, str(key))
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is not None and (entry[0] is None or entry[0] > time.time()):
+                self.entries.move_to_end(cache_key)
+                self.hits[endpoint] = self.hits.get(endpoint, 0) + 1
+                return entry[1]
+            self.misses[endpoint] = self.misses.get(endpoint, 0) + 1
+
+        value = fetch()#outside the lock so concurrent fetches of different keys don't wait on each other
+        if isinstance(value, dict) and 'error' in value:
+            return value
+
+        ttl = self.ttls.get(endpoint)
+        with self.lock:
+            self.entries[cache_key] = (None if ttl is None else time.time() + ttl, value)
+            self.entries.move_to_end(cache_key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            self.changes += 1
+            due = self.path and self.changes >= self.flush_every
+        if due:
+            self.flush()
+        return value
+
+    def invalidate(self, endpoint:str=None, key=None):
+        with self.lock:
+            for cache_key in list(self.entries):
+                if (endpoint is None or cache_key[0] == endpoint) and (key is None or cache_key[1] == str(key)):
+                    del self.entries[cache_key]
+                    self.changes += 1
+
+    def clear(self):
+        with self.lock:
+            self.changes += len(self.entries)
+            self.entries.clear()
+            self.hits.clear()
+            self.misses.clear()
+
+    def stats(self)->dict:
+        with self.lock:
+            endpoints = set(self.hits) | set(self.misses)
+            return {endpoint: {'hits': self.hits.get(endpoint, 0), 'misses': self.misses.get(endpoint, 0)}
+                    for endpoint in sorted(endpoints)}
+
+    def flush(self):
+        '''
+        writes the unexpired entries to path if anything changed since the last write, only the snapshot of the
+        entries is taken under the lock, the json and the disk write happen outside it
+        '''
+        if not self.path:
+            return
+        with self.write_lock:
+            with self.lock:
+                if not self.changes:
+                    return
+                now = time.time()
+                rows = [[endpoint, key, expires_at, value] for (endpoint, key), (expires_at, value) in self.entries.items()
+                        if expires_at is None or expires_at > now]
+                self.changes = 0
+            temp_path = f'{self.path}.{os.getpid()}.tmp'#written to a temporary file first so a crash never leaves half a cache
+            with open(temp_path, 'w') as f:
+                json.dump(rows, f)
+            os.replace(temp_path, self.path)
+
+    def load(self):
+        with open(self.path) as f:
+            rows = json.load(f)
+        now = time.time()
+        for endpoint, key, expires_at, value in rows[-self.maxsize:]:
+            if expires_at is None or expires_at > now:
+                self.entries[(endpoint, key)] = (expires_at, value)
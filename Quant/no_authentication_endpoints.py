@@ -1,156 +1,220 @@
-import requests
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 import pandas as pd
 from useful_tools import useful_tools
+from http_session import get_shared_session
+from metadata_cache import metadata_cache
+from rate_limiter import PRIORITY_LOW, PRIORITY_NORMAL, get_shared_scheduler
 import numpy as np
 import seaborn as sns
+try:
+    from orjson import loads as json_loads#optional, decodes big candle responses several times faster
+except ImportError:
+    from json import loads as json_loads
+
+def column_array(values:list):
+    '''
+    a typed numpy array for a column of ints or floats, anything else (strings, all missing) is left to pandas
+    so the dtypes come out the same as building the frame from rows: int64 only when every value is an int,
+    float64 (missing values as nan) as soon as one is a float or missing
+    '''
+    kinds = set(map(type, values))#the whole column, one late float must not be truncated to an int
+    try:
+        if kinds == {int}:
+            return np.fromiter(values, dtype=np.int64, count=len(values))
+        if kinds & {int, float} and kinds <= {int, float, type(None)}:
+            return np.fromiter((np.nan if value is None else value for value in values), dtype=np.float64, count=len(values))
+    except OverflowError:#ints past int64, pandas keeps those as objects
+        pass
+    return pd.Series(values).to_numpy()
+
+def run_coroutine(coro):#runs a coroutine to completion from plain scripts and from inside a running loop (e.g. jupyter)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
 class no_authentication_endpoints:
     
-    def __init__(self):
+    def __init__(self, session=None, public_base_url="https://api.elections.kalshi.com", store=None, cache=None, scheduler=None):
+        '''
+        session is shared by every request this client makes, by default the process wide pooled session from http_session
+        pass your own (anything with requests.Session's get/post) to change pooling/timeouts or to talk to a local test server
+        store is an optional candle_store, with one candles are kept on disk and only newer ones are downloaded
+        cache is the metadata_cache in front of the series/event/market info calls, pass one with a path to keep it between runs
+        scheduler is the request_scheduler (rate limits, retries) every call goes through, by default the process wide one
+        '''
         self.ut  = useful_tools()
+        self.session = session if session is not None else get_shared_session()
+        self.PUBLIC_BASE_URL = public_base_url
+        self.store = store
+        self.cache = cache if cache is not None else metadata_cache()
+        self.scheduler = scheduler if scheduler is not None else get_shared_scheduler()
+
+    def public_get(self, url, params=None, priority:int=PRIORITY_NORMAL):#unauthenticated GET through the scheduler's read budget
+        return self.scheduler.send('read', lambda: self.session.get(url, params=params), priority)
     def get_series_info(self,series_id)->dict:#a series is a collection of related events
-        url = f"https://api.elections.kalshi.com/trade-api/v2/series/{series_id}"
-        response = requests.get(url)
-        series_data = response.json()
-        return series_data
+        url = f"{self.PUBLIC_BASE_URL}/trade-api/v2/series/{series_id}"
+        return self.cache.get('series', series_id, lambda: self.public_get(url).json())
 
     def all_markets_in_series(self,series_id)->dict:
-        markets_url = f"https://api.elections.kalshi.com/trade-api/v2/markets?series_ticker={series_id}&status=open"
-        markets_response = requests.get(markets_url)
+        markets_url = f"{self.PUBLIC_BASE_URL}/trade-api/v2/markets?series_ticker={series_id}&status=open"
+        markets_response = self.public_get(markets_url)
         markets_data = markets_response.json()
         return markets_data
 
-    def get_all_markets(self, series_ticker):
-        """Fetch all markets for a series, handling pagination"""
-        all_markets = []
-        cursor = None
-        base_url = "https://api.elections.kalshi.com/trade-api/v2/markets"
+    def iter_markets(self, series_ticker, fields=None, page_size:int=100):
+        '''
+        yields every market of a series as the pages arrive, the next page is already being fetched in the background
+        while the current one is consumed
+        fields (e.g. ['ticker', 'volume']) keeps only those keys of each market, so a huge series can be scanned with
+        no more than a page of full market dicts in memory
+        '''
+        url = f"{self.PUBLIC_BASE_URL}/trade-api/v2/markets"
 
-        while True:
-            # Build URL with cursor if we have one
-            url = f"{base_url}?series_ticker={series_ticker}&limit=100"
+        def fetch(cursor):
+            params = {'series_ticker': series_ticker, 'limit': page_size}
             if cursor:
-                url += f"&cursor={cursor}"
+                params['cursor'] = cursor
+            return json_loads(self.public_get(url, params, PRIORITY_LOW).content)
+
+        with ThreadPoolExecutor(1) as pool:
+            page = pool.submit(fetch, None)
+            while page is not None:
+                data = page.result()
+                cursor = data.get('cursor')
+                page = pool.submit(fetch, cursor) if cursor else None#request the next page before handing out this one
+                for market in data['markets']:
+                    yield market if fields is None else {key: market.get(key) for key in fields}
 
-            response = requests.get(url)
-            data = response.json()
-
-            # Add markets from this page
-            all_markets.extend(data['markets'])
-
-            # Check if there are more pages
-            cursor = data.get('cursor')
-            if not cursor:
-                break
-
-            print(f"Fetched {len(data['markets'])} markets, total: {len(all_markets)}")
-
-        return all_markets
+    def get_all_markets(self, series_ticker):
+        """Fetch all markets for a series, handling pagination"""
+        return list(self.iter_markets(series_ticker))
 
     def list_of_all_historical_markets_in_a_series(self,series_ticker):
-        markets = self.get_all_markets(series_ticker)
-        market_list = []
-        for market_dict in markets:
-            m = market_dict['ticker']
-            market_list.append(m)
-        return market_list
+        return [market['ticker'] for market in self.iter_markets(series_ticker, ['ticker'])]
    
 
 
 
 
     def get_event_info(self,event_id)-> dict:#an event is a collection of markets
-        event_url = f"https://api.elections.kalshi.com/trade-api/v2/events/{event_id}"
-        event_response = requests.get(event_url)
-        event_data = event_response.json()
-        return event_data
+        event_url = f"{self.PUBLIC_BASE_URL}/trade-api/v2/events/{event_id}"
+        return self.cache.get('event', event_id, lambda: self.public_get(event_url).json())
 
     def get_market_info(self,market_id)-> dict:#market is a specific event that trades on a binary outcome
-        url = f"https://api.elections.kalshi.com/trade-api/v2/markets/{market_id}"
-        response = requests.get(url)
-        market_data = response.json()
-        return market_data
+        url = f"{self.PUBLIC_BASE_URL}/trade-api/v2/markets/{market_id}"
+        return self.cache.get('market', market_id, lambda: self.public_get(url).json())
+
+    def get_market_open_time(self, market_id)->int:#unix open time, cached for good since it never changes
+        def fetch():
+            open_time_iso = self.get_market_info(market_id)['market']['open_time'] #gets time in iso
+            dt = datetime.fromisoformat(open_time_iso.replace('Z', '+00:00'))  # parse UTC
+            return int(dt.timestamp())#convert to unix
+        return self.cache.get('market_open_time', market_id, fetch)
     
     
-    def get_candle_sticks(self, series_id, market_id, period_interval:int, start=None, end=None):#will make an integration for custom start/end later
+    def get_candle_sticks(self, series_id, market_id, period_interval:int, start=None, end=None):
         '''
         for the period interval you can either choose 1 (1 min), 60 (1 hour), or 1440 (1 day)-must be an int
-        start/end must be in unix time(might make it so you can just enter an array)
+        start/end must be in unix time, start defaults to the market's open time and end to now
         '''
-        url = f"https://api.elections.kalshi.com/trade-api/v2/series/{series_id}/markets/{market_id}/candlesticks"
+        url = f"{self.PUBLIC_BASE_URL}/trade-api/v2/series/{series_id}/markets/{market_id}/candlesticks"
         
-        open_time_iso = self.get_market_info(market_id)['market']['open_time'] #gets time in iso
-        dt = datetime.fromisoformat(open_time_iso.replace('Z', '+00:00'))  # parse UTC
-        open_time = str(int(dt.timestamp()))#convert to unix
+        if start is None:
+            start = self.get_market_open_time(market_id)
+        if end is None:
+            end = int(datetime.now(timezone.utc).timestamp())
         
         params = {
             "period_interval": period_interval,  
-            "start_ts": open_time,
-            "end_ts": str(int(datetime.now(timezone.utc).timestamp()))
+            "start_ts": str(int(start)),
+            "end_ts": str(int(end))
         }
 
-        response = requests.get(url, params=params).json()
+        response = json_loads(self.public_get(url, params, PRIORITY_LOW).content)
         return response
 
     import pandas as pd
 
+    def stored_candle_sticks(self, series_id, market_id, period_interval:int, start=None, end=None):
+        '''
+        get_candle_sticks through the store: only candles newer than the last stored end_period_ts are requested,
+        then everything between start and end is read back from disk. without a store it is just get_candle_sticks
+        '''
+        if self.store is None:
+            return self.get_candle_sticks(series_id, market_id, period_interval, start, end)
+
+        data = {'ticker': market_id}
+        last = self.store.last_end_ts(series_id, market_id, period_interval)
+        if last is None or end is None or last < int(end):
+            # the newest stored candle may have been built while its period was still open, so it is requested again
+            fetch_start = None if last is None else last - period_interval * 60
+            data = self.get_candle_sticks(series_id, market_id, period_interval, fetch_start)
+            self.store.add(series_id, market_id, period_interval, data.get('candlesticks', []))
+        data['candlesticks'] = self.store.load(series_id, market_id, period_interval, start, end)
+        return data
+
     def candle_sticks_in_pandas(self,series_id, market_id, period_interval:int, start=None, end=None):
-        data = self.get_candle_sticks(series_id, market_id, period_interval, start, end)
-
-        # Flatten the nested dictionary for each candlestick
-        flattened_data = []
-        for candle in data['candlesticks']:
-            flat_candle = {
-                'end_period_ts': candle['end_period_ts'],
-                'open_interest': candle['open_interest'],
-                'volume': candle['volume'],
-            }
-            # Flatten price
-            for key, value in candle['price'].items():
-                flat_candle[f'price_{key}'] = value
-            # Flatten yes_ask
-            for key, value in candle['yes_ask'].items():
-                flat_candle[f'yes_ask_{key}'] = value
-            # Flatten yes_bid
-            for key, value in candle['yes_bid'].items():
-                flat_candle[f'yes_bid_{key}'] = value
-
-            flattened_data.append(flat_candle)
-
-        df = pd.DataFrame(flattened_data)
-        #make conversion to date time format so its more readable
-        df['end_period_dt'] = pd.to_datetime(df['end_period_ts'], unit='s')
-        
-        cols = list(df.columns)#switch unix timestamp and datetime columns
-        i, j = cols.index('end_period_ts'), cols.index('end_period_dt')
-        cols[i], cols[j] = cols[j], cols[i]
-        df = df[cols]
+        data = self.stored_candle_sticks(series_id, market_id, period_interval, start, end)
+        return self.candles_to_pandas(data)
+
+    async def candle_sticks_for_markets_async(self, series_markets, period_interval:int, max_concurrency:int=16):
+        '''
+        candle_sticks_in_pandas for every [series, market] pair at once, up to max_concurrency markets in flight
+        each market's two round trips (market info, then candlesticks) run on a worker thread over the shared
+        session pool, so keep max_concurrency at or below the session's pool size
+        returns the data frames in the same order as series_markets
+        '''
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_concurrency) as pool:
+            fetches = [loop.run_in_executor(pool, self.stored_candle_sticks, pair[0], pair[1], period_interval)
+                       for pair in series_markets]
+            results = await asyncio.gather(*fetches)
+        return [self.candles_to_pandas(data) for data in results]
+
+    def candle_sticks_for_markets(self, series_markets, period_interval:int, max_concurrency:int=16):
+        return run_coroutine(self.candle_sticks_for_markets_async(series_markets, period_interval, max_concurrency))
+
+    def candles_to_pandas(self, data):
+        '''
+        one row per candle: end_period_dt, open_interest, volume, then price_*, yes_ask_* and yes_bid_* for every key
+        of the nested dicts, and end_period_ts last
+        built column by column straight into numpy arrays instead of one flat dict per candle
+        '''
+        candles = data['candlesticks']
+        columns = {'end_period_ts': column_array([candle['end_period_ts'] for candle in candles])}
+        for key in ['open_interest', 'volume']:
+            columns[key] = column_array([candle.get(key) for candle in candles])
+        for group in ['price', 'yes_ask', 'yes_bid']:
+            group_dicts = [candle[group] for candle in candles]
+            for key in dict.fromkeys(key for group_dict in group_dicts for key in group_dict):#every key, first seen order
+                columns[f'{group}_{key}'] = column_array([group_dict.get(key) for group_dict in group_dicts])
+
+        #make conversion to date time format so its more readable, then switch it with the unix timestamp column
+        end_period_ts = columns.pop('end_period_ts')
+        columns = {'end_period_dt': pd.to_datetime(end_period_ts, unit='s'), **columns, 'end_period_ts': end_period_ts}
+        return pd.DataFrame(columns, copy=False)
 
-        return df 
     def pairplot_and_heatmap_given_2_markets(self,series1, market1, series2, market2, period_interval):
         
-        df = self.candle_sticks_in_pandas(series1, market1, period_interval)
-        df2 = self.candle_sticks_in_pandas(series2, market2, period_interval)
+        df, df2 = self.candle_sticks_for_markets([[series1, market1], [series2, market2]], period_interval)
         returns = self.ut.mid_price_returns(df)
         returns2 = self.ut.mid_price_returns(df2)
-        self.ut.covariance_matrix(returns, returns2,True)
+        self.ut.covariance_matrix(returns, returns2,True)#lined up by end_period_ts
 
-    def heatmap_for_list_of_markets(self, series_markets,period_interval):
+    def heatmap_for_list_of_markets(self, series_markets,period_interval, max_concurrency:int=16, how:str='ffill', fill_limit:int=None):
         '''
         series_markets parameter should be a 2d array in format of [[series,market],[series2,market2]]
+        markets are fetched concurrently, max_concurrency at a time
+        the mid prices are joined on end_period_ts (how/fill_limit decide what fills a market's missing bars, see
+        useful_tools.panel_from_series) and each pair is correlated over the bars where both have a return
         '''
-        returns_matrix = []
-        for pair in series_markets:#put all returns in the matrix
-            df = self.candle_sticks_in_pandas(pair[0], pair[1], period_interval)
-            returns = self.ut.mid_price_returns(df)
-            returns_matrix.append(returns)
-            
-        min_length = min(len(returns) for returns in returns_matrix)#find shortest length of returns array
-        returns_matrix_aligned = []
-        for returns in returns_matrix:#make all returns array same lenght keeping end but shortening the start
-            aligned = returns[-min_length:] if len(returns) > min_length else returns
-            returns_matrix_aligned.append(aligned)
-        
-        returns_matrix_aligned = np.array(returns_matrix_aligned)
-        correlation_matrix = np.corrcoef(returns_matrix_aligned)
-        sns.heatmap(correlation_matrix, annot=True, fmt=".4f", cmap="coolwarm")
\ No newline at end of file
+        frames = self.candle_sticks_for_markets(series_markets, period_interval, max_concurrency)
+        _, panel = self.ut.build_panel(frames, 'mid', how, fill_limit)
+        correlation_matrix = self.ut.panel_correlation(self.ut.panel_returns(panel))
+        sns.heatmap(correlation_matrix, annot=True, fmt=".4f", cmap="coolwarm")
+        return correlation_matrix
@@ -0,0 +1,131 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import requests
+
+PRIORITY_HIGH = 0#order placement and the order books it needs
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2#bulk history pulls
+
+class rate_limiter:
+    '''
+    token bucket shared between threads: rate requests per second on average, with bursts of up to burst requests
+    acquire() blocks until a request may go out, waiting callers are served lowest priority number first
+    '''
+    def __init__(self, rate:float, burst:int=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+        self.waiting = []#heap of (priority, arrival) tickets
+        self.arrivals = itertools.count()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority:int=PRIORITY_NORMAL):
+        with self.condition:
+            ticket = (priority, next(self.arrivals))
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    if self.waiting[0] != ticket:#someone more urgent (or earlier) goes first
+                        self.condition.wait()
+                        continue
+                    now = time.monotonic()
+                    if now < self.paused_until:
+                        self.condition.wait(self.paused_until - now)
+                        continue
+                    self.refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    self.condition.wait((1 - self.tokens) / self.rate)
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.condition.notify_all()
+
+    def pause(self, seconds:float):#nobody on this bucket sends for the next seconds (the server said it is overloaded)
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = min(self.tokens, 0.0)
+            self.condition.notify_all()
+
+
+class request_scheduler:
+    '''
+    one place every kalshi call goes through: separate read and write token buckets, and retries with jittered
+    exponential backoff on 429/5xx responses and connection errors, honouring Retry-After when the server sends it
+    a 429 pauses the whole bucket, since the limit is on the account and not on the one request
+    '''
+    def __init__(self, read_rate:float=20, write_rate:float=10, max_retries:int=5, base_delay:float=0.5,
+                 max_delay:float=30, retry_statuses=(429, 500, 502, 503, 504)):
+        self.budgets = {'read': rate_limiter(read_rate), 'write': rate_limiter(write_rate)}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = set(retry_statuses)
+        self.retries = 0
+
+    def backoff(self, attempt:int)->float:#full jitter: anywhere between 0 and the exponential delay
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def retry_after(self, response):
+        value = response.headers.get('Retry-After')
+        if value is None:
+            return None
+        try:
+            return min(self.max_delay, max(0.0, float(value)))
+        except ValueError:
+            pass
+        try:#the other allowed form is an http date
+            return min(self.max_delay, max(0.0, parsedate_to_datetime(value).timestamp() - time.time()))
+        except (TypeError, ValueError):
+            return None
+
+    def send(self, budget:str, send, priority:int=PRIORITY_NORMAL):
+        '''
+        send is called with no arguments for every attempt and returns a requests.Response, so anything that has
+        to be fresh per attempt (like a signed timestamp) belongs inside it
+        returns the last response, a connection error is raised once the retries are used up
+        '''
+        limiter = self.budgets[budget]
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire(priority)
+            try:
+                response = send()
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                time.sleep(self.backoff(attempt))
+                continue
+
+            if response.status_code not in self.retry_statuses or attempt == self.max_retries:
+                return response
+            self.retries += 1
+            delay = self.retry_after(response)
+            if delay is None:
+                delay = self.backoff(attempt)
+            if response.status_code == 429:
+                limiter.pause(delay)
+            else:
+                time.sleep(delay)
+
+
+shared = {'scheduler': None}#one set of budgets for every client in the process
+
+def get_shared_scheduler()->request_scheduler:
+    if shared['scheduler'] is None:
+        shared['scheduler'] = request_scheduler()
+    return shared['scheduler']
+
+def set_shared_scheduler(scheduler):
+    shared['scheduler'] = scheduler
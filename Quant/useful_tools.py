@@ -10,9 +10,12 @@ class useful_tools:
         pass
     def sharpe_ratio(self,returns):
         return np.mean(returns)/np.std(returns)
-    def mid_price_returns(self,df ):
+    def mid_price_returns(self,df ):#indexed by end_period_ts when the frame has it, so returns of different markets can be matched up
         df['mid'] = (df['yes_bid_close'] + df['yes_ask_close']) / 2
-        returns = np.log(df['mid'] / df['mid'].shift(1)).replace([np.inf, -np.inf], np.nan).dropna()   
+        returns = np.log(df['mid'] / df['mid'].shift(1))
+        if 'end_period_ts' in df:
+            returns.index = df['end_period_ts'].to_numpy()
+        returns = returns.replace([np.inf, -np.inf], np.nan).dropna()   
         return returns
         
     def prob_plot(self, data):
@@ -64,16 +67,20 @@ class useful_tools:
         plt.tight_layout()
         plt.show()
         
-    def covariance_matrix(self, returns1:list, returns2:list, graph:bool=False):#aligns the start dates, true or false for graph
-        r1 = np.array(returns1)
-        r2 = np.array(returns2)
-
-        # Trim the start of the longer array so both end at the same index
-        if r1.size > r2.size:
-            r1 = r1[-r2.size:]   
-        elif r2.size > r1.size:
-            r2 = r2[-r1.size:]
-        data = np.vstack([r1,r2])
+    def covariance_matrix(self, returns1:list, returns2:list, graph:bool=False):#true or false for graph
+        '''
+        returns as pandas Series indexed by end_period_ts (what mid_price_returns gives) are matched up bar by bar and
+        only bars both markets have are used, plain arrays must already be aligned and the same length
+        '''
+        if isinstance(returns1, pd.Series) and isinstance(returns2, pd.Series):
+            _, panel = self.panel_from_series([returns1, returns2], how='drop')
+            data = panel.T
+        else:
+            r1 = np.array(returns1)
+            r2 = np.array(returns2)
+            if r1.size != r2.size:
+                raise ValueError('returns of different lengths can only be lined up by time, pass pandas Series indexed by end_period_ts')
+            data = np.vstack([r1,r2])
         cov_m = np.cov(data)
         if graph==False:
             return cov_m
@@ -83,5 +90,68 @@ class useful_tools:
             sns.heatmap(df.corr(), annot=True, fmt=".4f", cmap="coolwarm")
 
             sns.pairplot(df)
-            
-    
\ No newline at end of file
+
+    def panel_from_series(self, series_list, how:str='ffill', fill_limit:int=None, dtype=np.float64):
+        '''
+        outer joins series indexed by unix time into one (timestamps, panel) pair, panel[t, i] is series i at timestamps[t]
+        how says what happens to the gaps: 'ffill' carries each series' last value forward (at most fill_limit bars if
+        given, nothing before a series starts), 'drop' keeps only the timestamps every series has, 'none' leaves nan
+        '''
+        if how not in ('ffill', 'drop', 'none'):
+            raise ValueError(f"how must be 'ffill', 'drop' or 'none', got {how!r}")
+        indexes = [np.asarray(series.index, dtype=np.int64) for series in series_list]
+        timestamps = np.unique(np.concatenate(indexes)) if indexes else np.empty(0, dtype=np.int64)
+        panel = np.full((len(timestamps), len(series_list)), np.nan, dtype=dtype)
+        for column, (series, index) in enumerate(zip(series_list, indexes)):
+            panel[np.searchsorted(timestamps, index), column] = np.asarray(series, dtype=dtype)
+
+        if how == 'ffill':
+            rows = np.arange(len(timestamps))
+            for column in range(panel.shape[1]):#a column at a time so the index arrays stay one column big
+                values = panel[:, column]
+                last_seen = np.maximum.accumulate(np.where(np.isnan(values), -1, rows))
+                fill = (last_seen >= 0) & np.isnan(values)
+                if fill_limit is not None:
+                    fill &= rows - last_seen <= fill_limit
+                values[fill] = values[last_seen[fill]]
+        elif how == 'drop':
+            keep = ~np.isnan(panel).any(axis=1)
+            timestamps, panel = timestamps[keep], panel[keep]
+        return timestamps, panel
+
+    def build_panel(self, frames, value:str='mid', how:str='ffill', fill_limit:int=None, dtype=np.float32):
+        '''
+        one column per candle data frame (candle_sticks_in_pandas output) joined on end_period_ts, see panel_from_series
+        value is a column name or 'mid' for the close mid price, float32 keeps thousands of markets small
+        '''
+        series_list = []
+        for df in frames:
+            values = (df['yes_bid_close'] + df['yes_ask_close']) / 2 if value == 'mid' else df[value]
+            series_list.append(pd.Series(values.to_numpy(), index=df['end_period_ts'].to_numpy()))
+        return self.panel_from_series(series_list, how, fill_limit, dtype)
+
+    def panel_returns(self, panel):#log returns bar to bar, rows line up with timestamps[1:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.log(panel[1:] / panel[:-1])
+        returns[np.isinf(returns)] = np.nan
+        return returns
+
+    def pairwise_moments(self, returns, min_periods:int):
+        # every pair of columns over only the rows both have, like pandas' pairwise complete corr/cov but as matrix products
+        present = (~np.isnan(returns)).astype(np.float64)
+        values = np.where(present > 0, returns, 0.0).astype(np.float64)
+        count = present.T @ present
+        sums = values.T @ present#sums[i, j] is the sum of column i over the rows column j also has
+        with np.errstate(divide='ignore', invalid='ignore'):
+            covariance = (values.T @ values - sums * sums.T / count) / (count - 1)
+            variance = ((values * values).T @ present - sums * sums / count) / (count - 1)
+        covariance[count < min_periods] = np.nan
+        return covariance, variance
+
+    def panel_covariance(self, returns, min_periods:int=2):
+        return self.pairwise_moments(returns, min_periods)[0]
+
+    def panel_correlation(self, returns, min_periods:int=2):
+        covariance, variance = self.pairwise_moments(returns, min_periods)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return covariance / np.sqrt(variance * variance.T)
@@ -0,0 +1,85 @@
+import numpy as np
+
+from rank_tables import HASH_OFFSETS, load_rank_tables
+from turn_odds import combination_indexes
+
+# Vectorized hand evaluation: every step works on whole columns of a (N, cards) array, so scoring a
+# batch costs a handful of NumPy passes and never creates a Card or HandAnalysis per hand.
+
+HASH_OFFSET_ARRAY = np.array(HASH_OFFSETS, dtype=np.int64)
+RANK_AXIS = np.arange(13)
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+
+class BatchEvaluator:
+    def __init__(self, tables=None):
+        if tables is None:
+            tables = load_rank_tables()
+        self.tables = tables
+        # zero copy views over the (possibly memory mapped) rank tables
+        self.strengths = np.frombuffer(tables.strengths, dtype=np.uint32)
+        self.flush_table = np.frombuffer(tables.flush_table, dtype=np.uint16)
+        self.count_tables = {card_count: np.frombuffer(table, dtype=np.uint16)
+                             for card_count, table in tables.count_tables.items()}
+
+    def evaluate(self, cards, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        cards = np.asarray(cards)
+        if cards.ndim != 2 or cards.shape[1] not in self.count_tables:
+            raise ValueError(f'cards must have shape (N, k) with k in {sorted(self.count_tables)}, got {cards.shape}')
+        if cards.size and (cards.min() < 0 or cards.max() > 51):
+            raise ValueError('card ids must be in range(52)')
+
+        ordinals = np.empty(len(cards), dtype=np.uint16)
+        for start in range(0, len(cards), chunk_size):
+            ordinals[start:start + chunk_size] = self.rank_chunk(cards[start:start + chunk_size])
+
+        categories = (self.strengths[ordinals] >> 20).astype(np.uint8)
+        return categories, ordinals
+
+    def rank_chunk(self, cards):
+        n, card_count = cards.shape
+        cards = cards.astype(np.int64, copy=False)
+        ranks = cards % 13
+        suits = cards // 13
+        rows = np.arange(n)[:, None]
+
+        rank_counts = np.bincount((rows * 13 + ranks).ravel(), minlength=n * 13).reshape(n, 13)
+        suit_counts = np.bincount((rows * 4 + suits).ravel(), minlength=n * 4).reshape(n, 4)
+
+        # cards still to be placed on each rank and the ones above it, as in hash_rank_counts
+        cards_left = card_count - (np.cumsum(rank_counts, axis=1) - rank_counts)
+        index = HASH_OFFSET_ARRAY[RANK_AXIS, cards_left, rank_counts].sum(axis=1)
+        ordinals = self.count_tables[card_count][index]
+
+        flush_rows = np.flatnonzero(suit_counts.max(axis=1) >= 5)
+        if flush_rows.size:
+            flush_suit = suit_counts[flush_rows].argmax(axis=1)
+            in_suit = suits[flush_rows] == flush_suit[:, None]
+            suit_ranks = np.where(in_suit, np.left_shift(1, ranks[flush_rows]), 0).sum(axis=1)
+            ordinals[flush_rows] = self.flush_table[suit_ranks]
+        return ordinals
+
+    def evaluate_omaha(self, holes, boards, hole_used: int = 2, board_used: int = 3):
+        # every (hole combination, board combination) pairing becomes one 5-card row, picked with the
+        # precomputed combination index tables, and each deal keeps its best row
+        holes, boards = np.asarray(holes), np.asarray(boards)
+        if len(holes) != len(boards):
+            raise ValueError('need one board per hand')
+        hole_indexes = np.array(combination_indexes(holes.shape[1], hole_used))
+        board_indexes = np.array(combination_indexes(boards.shape[1], board_used))
+
+        hole_parts = holes[:, hole_indexes]
+        board_parts = boards[:, board_indexes]
+        n, hole_combos, board_combos = len(holes), len(hole_indexes), len(board_indexes)
+        rows = np.concatenate([
+            np.broadcast_to(hole_parts[:, :, None, :], (n, hole_combos, board_combos, hole_used)),
+            np.broadcast_to(board_parts[:, None, :, :], (n, hole_combos, board_combos, board_used)),
+        ], axis=3).reshape(-1, hole_used + board_used)
+
+        _, ordinals = self.evaluate(rows)
+        best = ordinals.reshape(n, hole_combos * board_combos).max(axis=1)
+        return (self.strengths[best] >> 20).astype(np.uint8), best
+
+
+def evaluate_batch(cards, tables=None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    return BatchEvaluator(tables).evaluate(cards, chunk_size)
@@ -0,0 +1,105 @@
+from collections import OrderedDict
+
+from turn_odds import (Card, ENGINE_SUITS, RANK_MASK, card_to_int, cards_to_mask, evaluate_mask, find_draws_fast,
+                       high_card_info_from_strength, int_to_card, river_distribution, select_five_card_hand,
+                       strength_to_hand)
+
+# Two spots that only differ by relabelling suits have the same hand, draws and odds. Each suit gets a
+# signature (its rank mask in every card group, e.g. hole cards then board) and suits are renumbered
+# in descending signature order; suits with equal signatures are interchangeable, so every spot in an
+# isomorphism class lands on the same representative.
+
+
+def canonical_suit_map(*groups) -> list[int]:
+    masks = [cards_to_mask(group) for group in groups]
+    signatures = [tuple(mask >> 13 * suit & RANK_MASK for mask in masks) for suit in range(4)]
+    order = sorted(range(4), key=lambda suit: signatures[suit], reverse=True)
+    suit_map = [0] * 4
+    for new_suit, suit in enumerate(order):
+        suit_map[suit] = new_suit
+    return suit_map
+
+
+def map_card_id(card_id: int, suit_map) -> int:
+    suit_index, rank_index = divmod(card_id, 13)
+    return suit_map[suit_index] * 13 + rank_index
+
+
+def canonicalize(hole_cards, board=()):
+    '''
+    returns (key, suit_map): key is a tuple of one canonical card mask per group and suit_map[old suit
+    index] is the suit index used in the key
+    '''
+    groups = [[card_to_int(card) for card in hole_cards], [card_to_int(card) for card in board]]
+    suit_map = canonical_suit_map(*groups)
+    key = tuple(cards_to_mask(map_card_id(card_id, suit_map) for card_id in group) for group in groups)
+    return key, suit_map
+
+
+class ResultCache:
+    def __init__(self, maxsize: int = 100_000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, compute):
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+        value = compute()
+        self.entries[key] = value
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxsize': self.maxsize,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
+HAND_CACHE = ResultCache()
+ODDS_CACHE = ResultCache()
+
+
+def cached_hand_and_draws(cards, cache: ResultCache = HAND_CACHE):
+    # hand and draws only depend on the set of cards, so they are keyed on a single group; the five
+    # card hand is picked from the caller's own cards so it is the same as get_hand_and_draws gives
+    key, suit_map = canonicalize(cards)
+    canonical_mask = key[0]
+    value, draws_dict = cache.get(key, lambda: (evaluate_mask(canonical_mask), find_draws_fast(canonical_mask)))
+
+    cards_by_id = {card_to_int(card): card for card in cards}
+    result = (strength_to_hand(value), high_card_info_from_strength(value), select_five_card_hand(value, cards_by_id))
+
+    inverse = [suit_map.index(suit) for suit in range(4)]
+    original_draws = {}
+    for draw_name, outs in draws_dict.items():
+        original_draws[draw_name] = [unmap_out(out, inverse) for out in outs]
+    return result, original_draws
+
+
+def unmap_out(out, inverse):
+    if isinstance(out, Card):
+        return int_to_card(map_card_id(card_to_int(out), inverse))
+    if out.islower():
+        return ENGINE_SUITS[inverse[ENGINE_SUITS.index(out)]]
+    return out
+
+
+def cached_river_distribution(cards, cache: ResultCache = ODDS_CACHE):
+    # only the odds against a full unseen deck are cached, dead cards would have to be part of the key
+    key, _ = canonicalize(cards)
+    return dict(cache.get(key, lambda: river_distribution(cards)))
@@ -0,0 +1,151 @@
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from statistics import NormalDist
+
+from turn_odds import BitDeck, card_to_int, cards_to_mask, evaluate_mask
+
+SUITS = ['h', 's', 'c', 'd']
+VALUES = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
+
+
+@dataclass
+class EquityResult:
+    trials: int = 0
+    wins: int = 0
+    ties: int = 0
+    losses: int = 0
+    equity_sum: float = 0.0
+    equity_square_sum: float = 0.0
+    confidence: float = 0.95
+
+    @property
+    def win(self) -> float:
+        return self.wins / self.trials if self.trials else 0.0
+
+    @property
+    def tie(self) -> float:
+        return self.ties / self.trials if self.trials else 0.0
+
+    @property
+    def loss(self) -> float:
+        return self.losses / self.trials if self.trials else 0.0
+
+    @property
+    def equity(self) -> float:
+        # a tie is worth the hero's share of the pot
+        return self.equity_sum / self.trials if self.trials else 0.0
+
+    @property
+    def ci_half_width(self) -> float:
+        if self.trials < 2:
+            return math.inf
+        variance = (self.equity_square_sum - self.trials * self.equity ** 2) / (self.trials - 1)
+        z = NormalDist().inv_cdf((1 + self.confidence) / 2)
+        return z * math.sqrt(max(variance, 0.0) / self.trials)
+
+    def add(self, batch):
+        trials, wins, ties, losses, equity_sum, equity_square_sum = batch
+        self.trials += trials
+        self.wins += wins
+        self.ties += ties
+        self.losses += losses
+        self.equity_sum += equity_sum
+        self.equity_square_sum += equity_square_sum
+
+
+def remaining_card_ids(known_cards) -> list[int]:
+    deck = BitDeck(SUITS, VALUES)
+    for card in known_cards:
+        if deck.deal_id(card_to_int(card)) is None:
+            raise ValueError(f'{card} is dealt twice')
+    return sorted(deck.ids[:len(deck)])
+
+
+def simulate_batch(hero_ids, board_ids, opponent_ids, remaining_ids, trials, seed):
+    # opponent_ids holds a tuple of two card ids per known opponent and None per random one
+    rng = random.Random(seed)
+    hero_mask = cards_to_mask(hero_ids)
+    board_mask = cards_to_mask(board_ids)
+    known_masks = [cards_to_mask(hole) if hole is not None else None for hole in opponent_ids]
+    board_needed = 5 - len(board_ids)
+    needed = board_needed + 2 * known_masks.count(None)
+
+    wins = ties = losses = 0
+    equity_sum = equity_square_sum = 0.0
+    for _ in range(trials):
+        dealt = rng.sample(remaining_ids, needed)
+        full_board = board_mask | cards_to_mask(dealt[:board_needed])
+        hero_strength = evaluate_mask(hero_mask | full_board)
+
+        next_card = board_needed
+        best_opponent = 0
+        tied = 0
+        for hole_mask in known_masks:
+            if hole_mask is None:
+                hole_mask = 1 << dealt[next_card] | 1 << dealt[next_card + 1]
+                next_card += 2
+            strength = evaluate_mask(hole_mask | full_board)
+            if strength > best_opponent:
+                best_opponent = strength
+                tied = 1 if strength == hero_strength else 0
+            elif strength == best_opponent and strength == hero_strength:
+                tied += 1
+
+        if hero_strength > best_opponent:
+            wins += 1
+            share = 1.0
+        elif hero_strength == best_opponent:
+            ties += 1
+            share = 1 / (tied + 1)
+        else:
+            losses += 1
+            share = 0.0
+        equity_sum += share
+        equity_square_sum += share * share
+
+    return trials, wins, ties, losses, equity_sum, equity_square_sum
+
+
+def simulate_equity(hole_cards, board=(), opponents=1, target_ci=0.005, confidence=0.95, seed=0,
+                    batch_size=2000, min_trials=10_000, max_trials=2_000_000, workers=None) -> EquityResult:
+    '''
+    opponents is either how many random opponents to deal, or a list with two Cards per known
+    opponent and None per random one. Batches are seeded from (seed, batch number) and the stopping
+    rule is checked batch by batch in order, so the result does not depend on the number of workers.
+    '''
+    if isinstance(opponents, int):
+        opponents = [None] * opponents
+    if not opponents:
+        raise ValueError('need at least one opponent')
+    if len(board) > 5:
+        raise ValueError('a board has at most five cards')
+
+    known_cards = list(hole_cards) + list(board) + [c for hole in opponents if hole is not None for c in hole]
+    args = ([card_to_int(c) for c in hole_cards], [card_to_int(c) for c in board],
+            [tuple(card_to_int(c) for c in hole) if hole is not None else None for hole in opponents],
+            remaining_card_ids(known_cards), batch_size)
+
+    result = EquityResult(confidence=confidence)
+    workers = workers or os.cpu_count() or 1
+    batch_index = 0
+
+    def done():
+        return result.trials >= max_trials or (result.trials >= min_trials and result.ci_half_width <= target_ci)
+
+    if workers == 1:
+        while not done():
+            result.add(simulate_batch(*args, seed * 2 ** 32 + batch_index))
+            batch_index += 1
+        return result
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while not done():
+            seeds = [seed * 2 ** 32 + batch_index + i for i in range(workers)]
+            batch_index += workers
+            for batch in pool.map(simulate_batch, *zip(*[args] * workers), seeds):
+                if not done():
+                    result.add(batch)
+    return result
@@ -0,0 +1,279 @@
+import argparse
+import heapq
+import itertools
+import mmap
+import os
+import shutil
+import sys
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch_eval import BatchEvaluator
+from canonical import canonical_suit_map, map_card_id
+from incremental import IncrementalHand, enumerate_runouts
+from ranges import card_masks, combos_to_array, parse_cards, range_equity, strength_matrix
+from turn_odds import HandStrength, card_to_int
+
+# Precomputed flop and turn odds. A table holds, for every suit-isomorphic (hole cards, board) spot,
+# the exact equity against one random hand and how often each final hand category comes in over
+# every runout. Spots are keyed by their canonical card ids packed into one integer, the keys are
+# stored sorted, and the file is memory mapped, so a lookup is a binary search over mapped pages.
+#
+# The build is split into one shard per canonical board (1,755 flops, 16,432 turns). A shard scores
+# every hole card combo on its board in one range-vs-range pass, and shards are written to a parts
+# directory next to the table as they finish, so an interrupted build picks up where it stopped.
+# Boards that are not isomorphic never share a key, so the table is a k-way merge of the shards.
+
+TABLE_MAGIC = b'EQTYTBL1'
+BYTE_ORDER_MARK = 0xFEFF
+CATEGORY_COUNT = len(HandStrength)
+STREETS = {'flop': 3, 'turn': 4}
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TABLE_PATHS = {3: os.path.join(MODULE_DIR, 'flop_equity.bin'), 4: os.path.join(MODULE_DIR, 'turn_equity.bin')}
+ALL_COMBOS = list(itertools.combinations(range(52), 2))
+
+
+def pack_key(hole_ids, board_ids) -> int:
+    code = 0
+    for card_id in sorted(hole_ids) + sorted(board_ids):
+        code = code << 6 | card_id
+    return code
+
+
+def canonical_spot(hole_ids, board_ids):
+    suit_map = canonical_suit_map(hole_ids, board_ids)
+    return ([map_card_id(card_id, suit_map) for card_id in hole_ids],
+            [map_card_id(card_id, suit_map) for card_id in board_ids])
+
+
+def canonical_key(hole_ids, board_ids) -> int:
+    return pack_key(*canonical_spot(hole_ids, board_ids))
+
+
+def canonical_boards(board_size: int) -> list[tuple[int, ...]]:
+    boards = {tuple(sorted(canonical_spot([], board)[1])) for board in itertools.combinations(range(52), board_size)}
+    return sorted(boards, key=lambda board: pack_key([], board))
+
+
+def compute_spot(hole_ids, board_ids, evaluator=None):
+    '''
+    returns (equity against one random hand, final hand category counts indexed by HandStrength.value - 1)
+    '''
+    equity = range_equity([tuple(sorted(hole_ids))], ALL_COMBOS, list(board_ids), evaluator).equity_a
+    counts = [0] * CATEGORY_COUNT
+    hand = IncrementalHand(list(hole_ids) + list(board_ids))
+    for hand_name, count in enumerate_runouts(hand, 5 - len(board_ids)).items():
+        counts[hand_name.value - 1] = count
+    return equity, counts
+
+
+class EquityTable:
+    def __init__(self, keys, equities, distributions, board_size, source=None):
+        self.keys = keys
+        self.equities = equities
+        self.distributions = distributions
+        self.board_size = board_size
+        self.source = source
+
+    def __len__(self):
+        return len(self.keys)
+
+    def index(self, hole_ids, board_ids) -> int:
+        if len(board_ids) != self.board_size:
+            return -1
+        key = canonical_key(hole_ids, board_ids)
+        i = bisect_left(self.keys, key)
+        return i if i < len(self.keys) and self.keys[i] == key else -1
+
+    def entry(self, i: int):
+        counts = self.distributions[i * CATEGORY_COUNT:(i + 1) * CATEGORY_COUNT]
+        return self.equities[i], list(counts)
+
+    def lookup(self, hole_ids, board_ids):
+        i = self.index(hole_ids, board_ids)
+        return None if i < 0 else self.entry(i)
+
+
+def save_equity_table(keys, equities, distributions, board_size: int, path: str):
+    header = array('I', [BYTE_ORDER_MARK, board_size, len(keys)])
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(TABLE_MAGIC)
+        f.write(header.tobytes())
+        for section in (keys, equities, distributions):
+            f.write(section.tobytes())
+    os.replace(temp_path, path)
+
+
+def read_header(view, path):
+    if bytes(view[:len(TABLE_MAGIC)]) != TABLE_MAGIC:
+        raise ValueError(f'{path} is not an equity table file')
+    offset = len(TABLE_MAGIC)
+    bom, board_size, entry_count = view[offset:offset + 12].cast('I')
+    if bom != BYTE_ORDER_MARK:
+        raise ValueError(f'{path} was written on a machine with a different byte order than {sys.byteorder}')
+    return board_size, entry_count, offset + 12
+
+
+def load_equity_table(path: str) -> EquityTable:
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    board_size, entry_count, offset = read_header(view, path)
+
+    sections = []
+    for length, item_size, code in ((entry_count, 8, 'Q'), (entry_count, 4, 'f'),
+                                    (entry_count * CATEGORY_COUNT, 2, 'H')):
+        sections.append(view[offset:offset + length * item_size].cast(code))
+        offset += length * item_size
+    return EquityTable(*sections, board_size, source=mapped)
+
+
+def shard_path(parts_dir: str, board) -> str:
+    return os.path.join(parts_dir, f'board_{pack_key([], board):08d}.bin')
+
+
+def build_shard(board, parts_dir: str) -> str:
+    board = list(board)
+    board_mask = sum(1 << card_id for card_id in board)
+    combos = [combo for combo in ALL_COMBOS if not board_mask & (1 << combo[0] | 1 << combo[1])]
+    evaluator = BatchEvaluator()
+    equities = range_equity(combos, combos, board, evaluator).combo_equity_a
+
+    # final categories of every combo on every runout that does not reuse one of its cards
+    live_cards = [card_id for card_id in range(52) if not board_mask >> card_id & 1]
+    runouts = np.array(list(itertools.combinations(live_cards, 5 - len(board))), dtype=np.int64)
+    combo_array = combos_to_array(combos)
+    categories = evaluator.strengths[strength_matrix(evaluator, combo_array, board, runouts)] >> 20
+    live = (card_masks(combo_array)[:, None] & card_masks(runouts)[None, :]) == 0
+    counts = np.zeros((len(combos), CATEGORY_COUNT + 1), dtype=np.int64)
+    np.add.at(counts, (np.nonzero(live)[0], categories[live]), 1)
+
+    entries = {}
+    for i, combo in enumerate(combos):
+        key = canonical_key(combo, board)
+        if key not in entries:
+            entries[key] = (equities[combo], counts[i, 1:].tolist())
+
+    keys, equity_array, distributions = array('Q'), array('f'), array('H')
+    for key in sorted(entries):
+        equity, category_counts = entries[key]
+        keys.append(key)
+        equity_array.append(equity)
+        distributions.extend(category_counts)
+
+    path = shard_path(parts_dir, board)
+    save_equity_table(keys, equity_array, distributions, len(board), path)
+    return path
+
+
+def shard_entries(s: int, shard: EquityTable):
+    for i, key in enumerate(shard.keys):
+        yield key, s, i
+
+
+def merge_shards(shard_paths, board_size: int, path: str):
+    # a k-way merge straight from the mapped shards into one file per section, which are then
+    # concatenated, so the merge never holds the table in memory
+    shards = [load_equity_table(shard) for shard in shard_paths]
+    entry_count = sum(len(shard) for shard in shards)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    section_paths = [f'{temp_path}.{section}' for section in range(3)]
+    sections = [open(section_path, 'wb') for section_path in section_paths]
+    try:
+        for key, s, i in heapq.merge(*(shard_entries(s, shard) for s, shard in enumerate(shards))):
+            shard = shards[s]
+            sections[0].write(array('Q', [key]).tobytes())
+            sections[1].write(array('f', [shard.equities[i]]).tobytes())
+            sections[2].write(shard.distributions[i * CATEGORY_COUNT:(i + 1) * CATEGORY_COUNT].tobytes())
+    finally:
+        for section in sections:
+            section.close()
+
+    with open(temp_path, 'wb') as f:
+        f.write(TABLE_MAGIC)
+        f.write(array('I', [BYTE_ORDER_MARK, board_size, entry_count]).tobytes())
+        for section_path in section_paths:
+            with open(section_path, 'rb') as section:
+                shutil.copyfileobj(section, f)
+            os.remove(section_path)
+    os.replace(temp_path, path)
+
+
+def build_equity_table(board_size: int = 3, path: str | None = None, boards=None, workers: int | None = None,
+                       show: bool = False) -> str:
+    '''
+    builds (or finishes building) the table for 3 or 4 board cards; boards limits the build to the
+    classes of the given boards (lists of card ids), the other spots are left to live computation
+    '''
+    path = path or DEFAULT_TABLE_PATHS[board_size]
+    parts_dir = f'{path}.parts'
+    os.makedirs(parts_dir, exist_ok=True)
+
+    if boards is None:
+        boards = canonical_boards(board_size)
+    else:
+        boards = sorted({tuple(sorted(canonical_spot([], board)[1])) for board in boards},
+                        key=lambda board: pack_key([], board))
+    pending = [board for board in boards if not os.path.exists(shard_path(parts_dir, board))]
+    if show:
+        print(f'{len(boards) - len(pending)} of {len(boards)} boards already built')
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for done, shard in enumerate(pool.map(build_shard, pending, [parts_dir] * len(pending)), 1):
+            if show:
+                print(f'[{done}/{len(pending)}] {shard}')
+
+    merge_shards([shard_path(parts_dir, board) for board in boards], board_size, path)
+    return path
+
+
+LOADED_TABLES = {}
+
+
+def default_table(board_size: int):
+    if board_size not in LOADED_TABLES:
+        path = DEFAULT_TABLE_PATHS.get(board_size)
+        LOADED_TABLES[board_size] = load_equity_table(path) if path and os.path.exists(path) else None
+    return LOADED_TABLES[board_size]
+
+
+def spot_odds(hole_cards, board, table=None, evaluator=None):
+    '''
+    equity against one random hand and {HandStrength: runouts} for Cards on a flop or turn, read from
+    table (by default the table built for that street, when there is one) or computed live
+    '''
+    hole_ids = [card_to_int(card) for card in hole_cards]
+    board_ids = [card_to_int(card) for card in board]
+    if table is None:
+        table = default_table(len(board_ids))
+    entry = table.lookup(hole_ids, board_ids) if table is not None else None
+    if entry is None:
+        entry = compute_spot(hole_ids, board_ids, evaluator)
+
+    equity, counts = entry
+    distribution = {HandStrength(i + 1): count for i, count in enumerate(counts) if count}
+    return equity, distribution
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a precomputed flop or turn equity table.')
+    parser.add_argument('--street', choices=sorted(STREETS), default='flop')
+    parser.add_argument('--path', default=None, help='table file (default: next to this module)')
+    parser.add_argument('--boards', default=None, help='only build these boards, e.g. "AhKd7c, 2c2d9h"')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    boards = [parse_cards(board) for board in args.boards.split(',')] if args.boards else None
+    if boards and any(len(board) != STREETS[args.street] for board in boards):
+        parser.error(f'every board must have {STREETS[args.street]} cards on the {args.street}')
+    path = build_equity_table(STREETS[args.street], args.path, boards, args.workers, show=True)
+    print(f'wrote {path} ({len(load_equity_table(path))} spots)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from equity import EquityResult, simulate_batch
+from incremental import IncrementalHand, enumerate_runouts
+from turn_odds import Card, HandStrength, card_to_int, cards_to_mask, evaluate_cards, strength_to_hand
+
+# Batch analysis of hand histories. Records are read lazily, handed to a process pool in chunks with
+# a bounded number of chunks in flight, and written back in input order as soon as the oldest chunk
+# is done, so memory stays flat however long the log is. Each record is seeded from its line number,
+# which keeps the equity estimates identical for any number of workers.
+#
+# One record per line: hole cards, then the board, e.g. "Ah Kd | Qs Jc 2d 7h". Without a "|" the
+# first two cards are the hole cards. Blank lines and lines starting with "#" are skipped.
+
+DEFAULT_TRIALS = 2000
+DEFAULT_CHUNK_SIZE = 64
+CATEGORY_COLUMNS = [hand_name.name.lower() for hand_name in reversed(HandStrength)]
+CSV_COLUMNS = ['line', 'hole', 'board', 'hand', 'equity', 'equity_ci', 'win', 'tie', 'loss', 'trials',
+               'runouts'] + CATEGORY_COLUMNS + ['error']
+
+
+def parse_card_text(text: str) -> list[Card]:
+    text = text.replace(' ', '').replace(',', '').replace('\t', '')
+    if len(text) % 2:
+        raise ValueError(f'cannot split {text!r} into cards')
+    return [Card(text[i + 1].lower(), text[i].upper()) for i in range(0, len(text), 2)]
+
+
+def parse_record(line: str):
+    if '|' in line:
+        hole_text, board_text = line.split('|', 1)
+        hole_cards, board = parse_card_text(hole_text), parse_card_text(board_text)
+    else:
+        cards = parse_card_text(line)
+        hole_cards, board = cards[:2], cards[2:]
+    if len(hole_cards) != 2:
+        raise ValueError(f'expected 2 hole cards, got {len(hole_cards)}')
+    if len(board) > 5:
+        raise ValueError(f'a board has at most five cards, got {len(board)}')
+    if len(set(card.cardId for card in hole_cards + board)) != len(hole_cards) + len(board):
+        raise ValueError('a card is dealt twice')
+    return hole_cards, board
+
+
+def analyze_record(line_number: int, line: str, trials: int = DEFAULT_TRIALS, seed: int = 0) -> dict:
+    record = {'line': line_number, 'hole': '', 'board': '', 'error': ''}
+    try:
+        hole_cards, board = parse_record(line)
+    except ValueError as error:
+        record['error'] = str(error)
+        return record
+
+    hole_ids = [card_to_int(card) for card in hole_cards]
+    board_ids = [card_to_int(card) for card in board]
+    record['hole'] = ''.join(map(repr, hole_cards))
+    record['board'] = ''.join(map(repr, board))
+    if len(board_ids) >= 3:
+        record['hand'] = strength_to_hand(evaluate_cards(hole_ids + board_ids)).name.lower()
+
+        # exact final hand distribution over every runout still to come
+        hand = IncrementalHand(hole_ids + board_ids)
+        distribution = enumerate_runouts(hand, 5 - len(board_ids))
+        runouts = sum(distribution.values())
+        record['runouts'] = runouts
+        for hand_name, count in distribution.items():
+            record[hand_name.name.lower()] = count / runouts
+
+    if trials:
+        known_mask = cards_to_mask(hole_ids + board_ids)
+        remaining_ids = [card_id for card_id in range(52) if not known_mask >> card_id & 1]
+        result = EquityResult()
+        result.add(simulate_batch(hole_ids, board_ids, [None], remaining_ids, trials, seed * 2 ** 32 + line_number))
+        record.update(equity=result.equity, equity_ci=result.ci_half_width, win=result.win, tie=result.tie,
+                      loss=result.loss, trials=result.trials)
+    return record
+
+
+def analyze_chunk(chunk, trials, seed) -> list[dict]:
+    return [analyze_record(line_number, line, trials, seed) for line_number, line in chunk]
+
+
+def read_chunks(lines, chunk_size: int):
+    chunk = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        chunk.append((line_number, line))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def analyze_stream(lines, trials: int = DEFAULT_TRIALS, seed: int = 0, workers: int | None = None,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE):
+    '''
+    yields one record dict per hand history line, in input order; at most a few chunks per worker are
+    read ahead of the output
+    '''
+    workers = workers or os.cpu_count() or 1
+    chunks = read_chunks(lines, chunk_size)
+    if workers == 1:
+        for chunk in chunks:
+            yield from analyze_chunk(chunk, trials, seed)
+        return
+
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(analyze_chunk, chunk, trials, seed))
+            if len(pending) >= max_in_flight:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+class CsvRecordWriter:
+    def __init__(self, stream):
+        self.writer = csv.DictWriter(stream, CSV_COLUMNS, restval='')
+        self.writer.writeheader()
+
+    def write(self, record: dict):
+        self.writer.writerow(record)
+
+
+class JsonlRecordWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, record: dict):
+        self.stream.write(json.dumps(record) + '\n')
+
+
+RECORD_WRITERS = {'csv': CsvRecordWriter, 'jsonl': JsonlRecordWriter}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hand odds and equity for every record of a hand history log.')
+    parser.add_argument('input', nargs='?', default='-', help='hand history file, "-" for stdin (default)')
+    parser.add_argument('-o', '--output', default='-', help='output file, "-" for stdout (default)')
+    parser.add_argument('--format', choices=sorted(RECORD_WRITERS), default='csv')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--trials', type=int, default=DEFAULT_TRIALS,
+                        help='Monte Carlo trials per record for equity against one random hand, 0 to skip')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='records per worker task')
+    args = parser.parse_args()
+
+    source = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8', newline='')
+    try:
+        writer = RECORD_WRITERS[args.format](target)
+        for record in analyze_stream(source, args.trials, args.seed, args.workers, args.chunk_size):
+            writer.write(record)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+from turn_odds import (ENGINE_SUITS, FULL_DECK_MASK, HandStrength, STRAIGHT_OUTS, evaluate_rank_masks,
+                       find_draws_fast, strength_to_hand)
+
+
+class IncrementalHand:
+    # Street by street evaluator state. push/pop keep rank counts, suit counts, per-suit rank masks and
+    # the "ranks held at least n times" masks up to date with a fixed number of integer operations, so
+    # walking turns and rivers is push, evaluate, pop instead of rebuilding an analysis per runout.
+    def __init__(self, card_ids=()):
+        self.mask = 0
+        self.rank_counts = [0] * 13
+        self.suit_counts = [0, 0, 0, 0]
+        self.suit_masks = [0, 0, 0, 0]
+        # at_least[n] holds the ranks with n or more cards, at_least[1] is the straight mask
+        self.at_least = [0, 0, 0, 0, 0]
+        self.history = []
+        for card_id in card_ids:
+            self.push(card_id)
+
+    def __len__(self):
+        return len(self.history)
+
+    def push(self, card_id: int):
+        if self.mask >> card_id & 1:
+            raise ValueError(f'card {card_id} is already in the hand')
+        suit_index, rank_index = divmod(card_id, 13)
+        count = self.rank_counts[rank_index] + 1
+        self.rank_counts[rank_index] = count
+        self.at_least[count] |= 1 << rank_index
+        self.suit_counts[suit_index] += 1
+        self.suit_masks[suit_index] |= 1 << rank_index
+        self.mask |= 1 << card_id
+        self.history.append(card_id)
+
+    def pop(self) -> int:
+        card_id = self.history.pop()
+        suit_index, rank_index = divmod(card_id, 13)
+        count = self.rank_counts[rank_index]
+        self.rank_counts[rank_index] = count - 1
+        self.at_least[count] ^= 1 << rank_index
+        self.suit_counts[suit_index] -= 1
+        self.suit_masks[suit_index] ^= 1 << rank_index
+        self.mask ^= 1 << card_id
+        return card_id
+
+    def strength(self) -> int:
+        at_least = self.at_least
+        return evaluate_rank_masks(self.suit_masks, at_least[1], at_least[2], at_least[3], at_least[4])
+
+    def hand_name(self) -> HandStrength:
+        return strength_to_hand(self.strength())
+
+    def flush_draws(self) -> list[str]:
+        return [ENGINE_SUITS[s] for s in range(4) if self.suit_counts[s] == 4]
+
+    def straight_outs(self) -> int:
+        # 13-bit mask of the ranks that make (or improve) a straight, two bits is open ended or a
+        # double gutshot, one bit a gutshot
+        return STRAIGHT_OUTS[self.at_least[1]]
+
+    def straight_flush_outs(self) -> dict[str, int]:
+        return {ENGINE_SUITS[s]: STRAIGHT_OUTS[self.suit_masks[s]]
+                for s in range(4) if self.suit_counts[s] >= 4}
+
+    def draws(self):
+        return find_draws_fast(self.mask, self.hand_name())
+
+
+def enumerate_runouts(hand: IncrementalHand, cards_to_come: int, dead_mask: int = 0) -> dict[HandStrength, int]:
+    # every unordered runout of the remaining cards, e.g. 2 from a flop, scored by final HandStrength
+    output_dict = {}
+    remaining = [card_id for card_id in range(52) if (FULL_DECK_MASK & ~(hand.mask | dead_mask)) >> card_id & 1]
+
+    def deal(start, left):
+        if not left:
+            hand_name = hand.hand_name()
+            output_dict[hand_name] = output_dict.get(hand_name, 0) + 1
+            return
+        for i in range(start, len(remaining) - left + 1):
+            hand.push(remaining[i])
+            deal(i + 1, left - 1)
+            hand.pop()
+
+    deal(0, cards_to_come)
+    return output_dict
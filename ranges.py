@@ -0,0 +1,193 @@
+import argparse
+import itertools
+from dataclasses import dataclass
+
+import numpy as np
+
+from batch_eval import BatchEvaluator
+from turn_odds import ENGINE_SUITS, ENGINE_VALUES
+
+# Range vs range equity on a flop, turn or river. Every combo of both ranges is scored once against
+# every possible runout with the batch evaluator, which gives one (combos, runouts) strength matrix per
+# range; matchups are then whole-array comparisons of those matrices, with card removal handled by
+# masking out combo pairs that share a card and runouts that use a combo's cards.
+
+DEFAULT_ROW_CHUNK = 16
+
+
+def parse_cards(text: str) -> list[int]:
+    text = text.replace(' ', '').replace(',', '')
+    if len(text) % 2:
+        raise ValueError(f'cannot split {text!r} into cards')
+    return [ENGINE_SUITS.index(text[i + 1]) * 13 + ENGINE_VALUES.index(text[i].upper())
+            for i in range(0, len(text), 2)]
+
+
+def rank_combos(high: int, low: int, kind: str) -> list[tuple[int, int]]:
+    # kind is 's' for suited, 'o' for offsuit and '' for both
+    combos = []
+    for s1, s2 in itertools.product(range(4), repeat=2):
+        if high == low and s1 >= s2:
+            continue
+        if (kind == 's' and s1 != s2) or (kind == 'o' and s1 == s2):
+            continue
+        combos.append(tuple(sorted((s1 * 13 + high, s2 * 13 + low))))
+    return combos
+
+
+def parse_hand_class(token: str):
+    high, low, kind = ENGINE_VALUES.index(token[0]), ENGINE_VALUES.index(token[1]), token[2:3].lower()
+    if low > high:
+        high, low = low, high
+    return high, low, kind
+
+
+def parse_range(text: str) -> list[tuple[int, int]]:
+    '''
+    comma separated hand classes like "AKs, TT+, 76s, AQo, KQ", dashed spans "22-55" or "A2s-A5s",
+    "ATs+" for every kicker from T up to one below the A, and exact combos such as "AhKd"
+    '''
+    combos = {}
+    for token in (t.strip() for t in text.split(',')):
+        if not token:
+            continue
+        if len(token) == 4 and token[1] in ENGINE_SUITS and token[3] in ENGINE_SUITS:
+            combos[tuple(sorted(parse_cards(token)))] = None
+            continue
+
+        if '-' in token:
+            first, last = (parse_hand_class(part) for part in token.split('-'))
+            if first[0] == first[1]:
+                ranks = range(min(first[0], last[0]), max(first[0], last[0]) + 1)
+                classes = [(r, r, '') for r in ranks]
+            else:
+                ranks = range(min(first[1], last[1]), max(first[1], last[1]) + 1)
+                classes = [(first[0], r, first[2]) for r in ranks]
+        elif token.endswith('+'):
+            high, low, kind = parse_hand_class(token[:-1])
+            if high == low:
+                classes = [(r, r, '') for r in range(high, 13)]
+            else:
+                classes = [(high, r, kind) for r in range(low, high)]
+        else:
+            classes = [parse_hand_class(token)]
+
+        for high, low, kind in classes:
+            for combo in rank_combos(high, low, kind):
+                combos[combo] = None
+    return list(combos)
+
+
+@dataclass
+class RangeEquityResult:
+    wins: float = 0.0
+    ties: float = 0.0
+    deals: float = 0.0
+    matchups: int = 0
+    combo_equity_a: dict | None = None
+
+    @property
+    def equity_a(self) -> float:
+        return (self.wins + self.ties / 2) / self.deals if self.deals else 0.0
+
+    @property
+    def equity_b(self) -> float:
+        return 1 - self.equity_a if self.deals else 0.0
+
+    @property
+    def tie(self) -> float:
+        return self.ties / self.deals if self.deals else 0.0
+
+
+def combos_to_array(combos) -> np.ndarray:
+    return np.array(combos, dtype=np.int64).reshape(-1, 2)
+
+
+def card_masks(card_ids: np.ndarray) -> np.ndarray:
+    return np.bitwise_or.reduce(np.left_shift(np.int64(1), card_ids), axis=1)
+
+
+def runout_masks(runouts: np.ndarray) -> np.ndarray:
+    return card_masks(runouts) if runouts.shape[1] else np.zeros(len(runouts), dtype=np.int64)
+
+
+def strength_matrix(evaluator, combos, board, runouts):
+    # ordinal strength of every combo on every runout, as a (combos, runouts) array
+    n, r = len(combos), len(runouts)
+    rows = np.empty((n, r, 2 + len(board) + runouts.shape[1]), dtype=np.int64)
+    rows[:, :, :2] = combos[:, None, :]
+    rows[:, :, 2:2 + len(board)] = board
+    rows[:, :, 2 + len(board):] = runouts[None, :, :]
+    # runouts that reuse one of the combo's cards are never counted, score a harmless hand instead
+    clashes = (card_masks(combos)[:, None] & runout_masks(runouts)[None, :]) != 0
+    rows[clashes] = np.arange(rows.shape[2])
+    _, ordinals = evaluator.evaluate(rows.reshape(n * r, -1))
+    return ordinals.reshape(n, r).astype(np.int32)
+
+
+def range_equity(range_a, range_b, board, evaluator=None, row_chunk=DEFAULT_ROW_CHUNK) -> RangeEquityResult:
+    '''
+    range_a and range_b are range strings or lists of (card id, card id) combos, board is 3 to 5 card
+    ids (or a card string like "AhKd7c"); returns range A's equity against range B over every deal
+    '''
+    evaluator = evaluator or BatchEvaluator()
+    if isinstance(board, str):
+        board = parse_cards(board)
+    if not 3 <= len(board) <= 5:
+        raise ValueError('range equity needs a flop, turn or river board')
+    board_mask = sum(1 << card_id for card_id in board)
+
+    def prepare(combos):
+        combos = parse_range(combos) if isinstance(combos, str) else list(combos)
+        combos = [c for c in combos if not board_mask & (1 << c[0] | 1 << c[1])]
+        if not combos:
+            raise ValueError('a range has no combos left after removing board cards')
+        return combos_to_array(combos)
+
+    combos_a, combos_b = prepare(range_a), prepare(range_b)
+    live_cards = [c for c in range(52) if not board_mask >> c & 1]
+    runouts = np.array(list(itertools.combinations(live_cards, 5 - len(board))), dtype=np.int64)
+    runouts = runouts.reshape(len(runouts), 5 - len(board))
+
+    strengths_a = strength_matrix(evaluator, combos_a, board, runouts)
+    strengths_b = strength_matrix(evaluator, combos_b, board, runouts)
+    masks_a, masks_b = card_masks(combos_a), card_masks(combos_b)
+    masks_runouts = runout_masks(runouts)
+    live_a = (masks_runouts[None, :] & masks_a[:, None]) == 0
+    live_b = (masks_runouts[None, :] & masks_b[:, None]) == 0
+
+    result = RangeEquityResult(combo_equity_a={})
+    for start in range(0, len(combos_a), row_chunk):
+        stop = start + row_chunk
+        # (a chunk, b, runouts): a deal counts when the combos are disjoint and the runout misses both
+        disjoint = (masks_a[start:stop, None] & masks_b[None, :]) == 0
+        live = live_a[start:stop, None, :] & live_b[None, :, :] & disjoint[:, :, None]
+        difference = strengths_a[start:stop, None, :] - strengths_b[None, :, :]
+        wins = ((difference > 0) & live).sum(axis=(1, 2))
+        ties = ((difference == 0) & live).sum(axis=(1, 2))
+        deals = live.sum(axis=(1, 2))
+
+        result.wins += float(wins.sum())
+        result.ties += float(ties.sum())
+        result.deals += float(deals.sum())
+        result.matchups += int(disjoint.sum())
+        for i, combo in enumerate(combos_a[start:stop]):
+            if deals[i]:
+                result.combo_equity_a[tuple(int(c) for c in combo)] = float((wins[i] + ties[i] / 2) / deals[i])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Equity of one hand range against another.')
+    parser.add_argument('range_a', help='e.g. "AKs, TT+, 76s"')
+    parser.add_argument('range_b')
+    parser.add_argument('board', help='3 to 5 cards, e.g. "Ah Kd 7c 2s"')
+    args = parser.parse_args()
+
+    result = range_equity(args.range_a, args.range_b, args.board)
+    print(f'range A {result.equity_a:.2%}  range B {result.equity_b:.2%}  ties {result.tie:.2%}  '
+          f'({result.matchups} matchups, {int(result.deals)} deals)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import mmap
+import os
+import sys
+from array import array
+
+from turn_odds import HandStrength, RANK_MASK, evaluate_mask, strength_to_hand
+
+# Rank tables map any 5, 6 or 7 card set to an ordinal strength (1 is the worst 5-card hand, 7462 a
+# royal flush). Hands with a flush are looked up by the flush suit's 13-bit rank mask; every other
+# hand only depends on how many cards of each rank it holds, and that count vector is turned into a
+# dense index with a perfect hash (its position in lexicographic order among vectors with the same sum).
+
+TABLE_MAGIC = b'RANKTBL1'
+BYTE_ORDER_MARK = 0xFEFF
+CARD_COUNTS = (5, 6, 7)
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rank_tables.bin')
+
+
+def count_vectors(ranks_left: int, cards_left: int) -> int:
+    return VECTOR_COUNTS[ranks_left][cards_left] if cards_left >= 0 else 0
+
+
+def build_vector_counts():
+    # VECTOR_COUNTS[n][k] is how many ways n ranks can hold k cards with at most 4 of each rank
+    counts = [[0] * 8 for _ in range(14)]
+    counts[0][0] = 1
+    for n in range(1, 14):
+        for k in range(8):
+            counts[n][k] = sum(counts[n - 1][k - c] for c in range(5) if k - c >= 0)
+    return counts
+
+
+VECTOR_COUNTS = build_vector_counts()
+
+# HASH_OFFSETS[rank][cards_left][count] is how many vectors sort before one that puts `count` cards on
+# `rank` while `cards_left` cards are still to be placed on this and the higher ranks
+HASH_OFFSETS = [[[sum(count_vectors(12 - rank, cards_left - v) for v in range(count)) for count in range(5)]
+                 for cards_left in range(8)]
+                for rank in range(13)]
+
+
+def hash_rank_counts(rank_counts, card_count: int) -> int:
+    index = 0
+    cards_left = card_count
+    for rank, count in enumerate(rank_counts):
+        if count:
+            index += HASH_OFFSETS[rank][cards_left][count]
+            cards_left -= count
+    return index
+
+
+def rank_count_vectors(card_count: int, rank: int = 0, prefix=()):
+    if rank == 13:
+        if card_count == 0:
+            yield prefix
+        return
+    for count in range(min(4, card_count) + 1):
+        yield from rank_count_vectors(card_count - count, rank + 1, prefix + (count,))
+
+
+def vector_to_mask(rank_counts) -> int:
+    # deals the suits round robin so no suit ever holds more than two of the (at most 7) cards
+    mask = 0
+    suit = 0
+    for rank, count in enumerate(rank_counts):
+        for _ in range(count):
+            mask |= 1 << (suit * 13 + rank)
+            suit = (suit + 1) % 4
+    return mask
+
+
+CARD_RANKS = [card_id % 13 for card_id in range(52)]
+CARD_SUITS = [card_id // 13 for card_id in range(52)]
+
+
+class RankTables:
+    def __init__(self, strengths, flush_table, count_tables, source=None):
+        self.strengths = strengths
+        self.flush_table = flush_table
+        self.count_tables = count_tables
+        self.source = source
+
+    def __len__(self):
+        return len(self.strengths) - 1
+
+    def rank_mask(self, mask: int) -> int:
+        rank_counts = [0] * 13
+        card_count = 0
+        for suit in range(4):
+            suit_ranks = mask >> 13 * suit & RANK_MASK
+            if suit_ranks.bit_count() >= 5:
+                return self.flush_table[suit_ranks]
+            card_count += suit_ranks.bit_count()
+            while suit_ranks:
+                rank = suit_ranks.bit_length() - 1
+                rank_counts[rank] += 1
+                suit_ranks ^= 1 << rank
+        return self.count_tables[card_count][hash_rank_counts(rank_counts, card_count)]
+
+    def rank(self, card_ids) -> int:
+        rank_counts = [0] * 13
+        suit_counts = [0, 0, 0, 0]
+        for card_id in card_ids:
+            rank_counts[CARD_RANKS[card_id]] += 1
+            suit_counts[CARD_SUITS[card_id]] += 1
+
+        flush_count = max(suit_counts)
+        if flush_count >= 5:
+            flush_suit = suit_counts.index(flush_count)
+            suit_ranks = 0
+            for card_id in card_ids:
+                if CARD_SUITS[card_id] == flush_suit:
+                    suit_ranks |= 1 << CARD_RANKS[card_id]
+            return self.flush_table[suit_ranks]
+
+        card_count = len(card_ids)
+        return self.count_tables[card_count][hash_rank_counts(rank_counts, card_count)]
+
+    def strength(self, ordinal: int) -> int:
+        return self.strengths[ordinal]
+
+    def hand_name(self, ordinal: int) -> HandStrength:
+        return strength_to_hand(self.strengths[ordinal])
+
+
+def build_rank_tables() -> RankTables:
+    five_card_strengths = {evaluate_mask(vector_to_mask(v)) for v in rank_count_vectors(5)}
+    five_card_strengths.update(evaluate_mask(m) for m in range(1 << 13) if m.bit_count() == 5)
+    strengths = array('I', [0] + sorted(five_card_strengths))
+    ordinals = {value: i for i, value in enumerate(strengths) if i}
+
+    flush_table = array('H', [ordinals[evaluate_mask(m)] if m.bit_count() >= 5 else 0 for m in range(1 << 13)])
+
+    count_tables = {}
+    for card_count in CARD_COUNTS:
+        table = array('H', bytes(2 * count_vectors(13, card_count)))
+        for rank_counts in rank_count_vectors(card_count):
+            table[hash_rank_counts(rank_counts, card_count)] = ordinals[evaluate_mask(vector_to_mask(rank_counts))]
+        count_tables[card_count] = table
+
+    return RankTables(strengths, flush_table, count_tables)
+
+
+def save_rank_tables(tables: RankTables, path: str = DEFAULT_TABLE_PATH):
+    # header: magic, byte order mark, then the length of every array in file order
+    sections = [tables.strengths, tables.flush_table] + [tables.count_tables[c] for c in CARD_COUNTS]
+    header = array('I', [BYTE_ORDER_MARK] + [len(section) for section in sections])
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(TABLE_MAGIC)
+        f.write(header.tobytes())
+        for section in sections:
+            f.write(section.tobytes())
+    # written under a temporary name so concurrent builders never expose a half written file
+    os.replace(temp_path, path)
+
+
+def load_rank_tables(path: str = DEFAULT_TABLE_PATH, build: bool = True) -> RankTables:
+    if not os.path.exists(path):
+        if not build:
+            raise FileNotFoundError(path)
+        save_rank_tables(build_rank_tables(), path)
+
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mapped[:len(TABLE_MAGIC)] != TABLE_MAGIC:
+        raise ValueError(f'{path} is not a rank table file')
+    view = memoryview(mapped)
+    offset = len(TABLE_MAGIC)
+    header = view[offset:offset + 4 * 6].cast('I')
+    if header[0] != BYTE_ORDER_MARK:
+        raise ValueError(f'{path} was written on a machine with a different byte order than {sys.byteorder}')
+    offset += 4 * 6
+
+    sections = []
+    for length, item_size, code in zip(header[1:], (4, 2, 2, 2, 2), 'IHHHH'):
+        sections.append(view[offset:offset + length * item_size].cast(code))
+        offset += length * item_size
+
+    strengths, flush_table, *count_tables = sections
+    return RankTables(strengths, flush_table, dict(zip(CARD_COUNTS, count_tables)), source=mapped)
+
+
+if __name__ == '__main__':
+    save_rank_tables(build_rank_tables())
+    print(f'wrote {DEFAULT_TABLE_PATH}')
@@ -1,38 +1,74 @@
+import json
 import random
+import time
+from collections import Counter, defaultdict
 from enum import Enum, auto
 from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import combinations
+
+
+# Integer/bitmask engine: a card is suit_index * 13 + rank_index (rank_index 0 is '2', 12 is 'A'),
+# so a set of cards is a 52-bit mask made of four 13-bit rank masks, one per suit.
+ENGINE_SUITS = 'hdcs'
+ENGINE_VALUES = '23456789TJQKA'
 
 
 class Card:
-    def __init__(self, suit: str, card_value: str):
-        self.suit: str = suit
-        self.cardValue: str = card_value
-        self.suitMatters: bool = False
-
-        face_cards = {'A': 14, 'K': 13, 'Q': 12, 'J': 11, 'T': 10}
-        if self.cardValue in face_cards:
-            self.numberValue = face_cards[self.cardValue]
-        else:
-            self.numberValue = int(self.cardValue)
+    # The 52 cards are built once and interned: Card(suit, value) hands back the shared instance, so
+    # == and hash are the card's identity and dealing allocates nothing. Instances are read only. Rank
+    # or suit comparisons are always spelled out with matches, against another card's rank, a suit
+    # letter, a rank letter or a numberValue.
+    __slots__ = ('suit', 'cardValue', 'numberValue', 'suitIndex', 'rankIndex', 'cardId')
+    interned: dict = {}
+    by_id: list = []
+
+    def __new__(cls, suit: str, card_value: str):
+        try:
+            return cls.interned[suit, card_value]
+        except KeyError:
+            raise ValueError(f'no such card: {card_value!r} of {suit!r}') from None
+
+    @classmethod
+    def build(cls, suit_index: int, rank_index: int):
+        card = object.__new__(cls)
+        for name, value in (('suit', ENGINE_SUITS[suit_index]), ('cardValue', ENGINE_VALUES[rank_index]),
+                            ('numberValue', rank_index + 2), ('suitIndex', suit_index),
+                            ('rankIndex', rank_index), ('cardId', suit_index * 13 + rank_index)):
+            object.__setattr__(card, name, value)
+        return card
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Card objects are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Card objects are immutable')
+
+    def __reduce__(self):
+        return Card, (self.suit, self.cardValue)
 
     def __repr__(self):
         return f'{self.cardValue}{self.suit}'
 
+    def __hash__(self):
+        return self.cardId
+
     def __eq__(self, other):
-        if isinstance(other, Card):
-            if self.suitMatters or other.suitMatters:
-                return self.cardValue == other.cardValue and self.suit == other.suit
-            else:
-                return self.cardValue == other.cardValue
+        return self is other
 
-        elif isinstance(other, str):
-            if other.islower():
-                return self.suit == other
+    def matches(self, thing) -> bool:
+        # the suit-agnostic comparison: another card's rank, a suit letter, a rank letter or a numberValue
+        if isinstance(thing, Card):
+            return self.rankIndex == thing.rankIndex
+
+        elif isinstance(thing, str):
+            if thing.islower():
+                return self.suit == thing
             else:
-                return self.cardValue == other
+                return self.cardValue == thing
 
-        elif isinstance(other, int):
-            return self.numberValue == other
+        elif isinstance(thing, int):
+            return self.numberValue == thing
 
         else:
             return False
@@ -47,7 +83,25 @@ class Card:
             return self.numberValue > other
 
     def __ge__(self, other):
-        return self > other or self.numberValue == other
+        if isinstance(other, Card):
+            return self.numberValue >= other.numberValue
+        else:
+            return self.numberValue >= other
+
+
+Card.by_id.extend(Card.build(suit_index, rank_index) for suit_index in range(4) for rank_index in range(13))
+Card.interned.update(((card.suit, card.cardValue), card) for card in Card.by_id)
+
+
+def count_matching(cards, thing) -> int:
+    return sum(1 for card in cards if card.matches(thing))
+
+
+def index_matching(cards, thing) -> int:
+    for i, card in enumerate(cards):
+        if card.matches(thing):
+            return i
+    raise ValueError(f'no card matching {thing!r}')
 
 
 class Deck:
@@ -68,7 +122,7 @@ class Deck:
 
         if value and suit:
             for i, c in enumerate(self.cards):
-                if c == value and c == suit:
+                if c.cardValue == value and c.suit == suit:
                     dealt_card = c
                     self.cards.pop(i)
                     break
@@ -79,11 +133,15 @@ class Deck:
     def shuffle(self):
         random.shuffle(self.cards)
 
-    def count_and_remove(self, thing):
+    def count_and_remove(self, thing, suit_matters: bool = False):
         card_count = 0
         i = 0
         while i < len(self.cards):
-            if self.cards[i] == thing:
+            if suit_matters:
+                matched = self.cards[i] is thing
+            else:
+                matched = self.cards[i].matches(thing)
+            if matched:
                 card_count += 1
                 self.cards.pop(i)
                 i -= 1
@@ -91,6 +149,114 @@ class Deck:
         return card_count
 
 
+class BitDeck:
+    # Same interface as Deck, but the cards live in a fixed array of card ids (see card_to_int) with a
+    # position index and a 52-bit mask. Removing a card swaps it just past the end of the live part of
+    # the array, so deal, removal, membership and counting are O(1) and restore(mark) brings back every
+    # card removed since mark() without allocating.
+    def __init__(self, suits, values, rng=None):
+        self.ids = [ENGINE_SUITS.index(suit) * 13 + ENGINE_VALUES.index(value) for suit in suits for value in values]
+        self.positions = [-1] * 52
+        for i, card_id in enumerate(self.ids):
+            self.positions[card_id] = i
+        self.size = len(self.ids)
+        self.mask = cards_to_mask(self.ids)
+        self.rng = rng or random
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return str(self.cards)
+
+    def __contains__(self, card):
+        card_id = card if isinstance(card, int) else card_to_int(card)
+        return bool(self.mask >> card_id & 1)
+
+    @property
+    def cards(self) -> list[Card]:
+        return [int_to_card(card_id) for card_id in self.ids[:self.size]]
+
+    def remove_id(self, card_id: int) -> bool:
+        if not self.mask >> card_id & 1:
+            return False
+        i = self.positions[card_id]
+        last = self.size - 1
+        last_id = self.ids[last]
+        self.ids[i], self.ids[last] = last_id, card_id
+        self.positions[last_id], self.positions[card_id] = i, last
+        self.size = last
+        self.mask ^= 1 << card_id
+        return True
+
+    def deal_id(self, card_id: int = None) -> int | None:
+        if card_id is None:
+            if not self.size:
+                return None
+            card_id = self.ids[self.size - 1]
+        return card_id if self.remove_id(card_id) else None
+
+    def deal_random_id(self) -> int:
+        card_id = self.ids[self.rng.randrange(self.size)]
+        self.remove_id(card_id)
+        return card_id
+
+    def deal(self, suit: str = None, value: str = None) -> Card:
+        if value and suit:
+            card_id = self.deal_id(ENGINE_SUITS.index(suit) * 13 + ENGINE_VALUES.index(value))
+        else:
+            card_id = self.deal_id()
+        return None if card_id is None else int_to_card(card_id)
+
+    def shuffle(self):
+        live = self.ids[:self.size]
+        self.rng.shuffle(live)
+        self.ids[:self.size] = live
+        for i, card_id in enumerate(live):
+            self.positions[card_id] = i
+
+    def matching_mask(self, thing, suit_matters: bool = False) -> int:
+        if isinstance(thing, Card):
+            if suit_matters:
+                return self.mask & 1 << thing.cardId
+            thing = thing.numberValue
+        if isinstance(thing, str):
+            if thing.islower():
+                return self.mask & RANK_MASK << 13 * ENGINE_SUITS.index(thing)
+            thing = ENGINE_VALUES.index(thing) + 2
+        return self.mask & RANK_COLUMN << thing - 2
+
+    def count(self, thing, suit_matters: bool = False) -> int:
+        return self.matching_mask(thing, suit_matters).bit_count()
+
+    def count_and_remove(self, thing, suit_matters: bool = False):
+        matches = self.matching_mask(thing, suit_matters)
+        card_count = 0
+        while matches:
+            card_id = matches.bit_length() - 1
+            self.remove_id(card_id)
+            matches ^= 1 << card_id
+            card_count += 1
+        return card_count
+
+    def mark(self) -> int:
+        return self.size
+
+    def restore(self, mark: int):
+        for i in range(self.size, mark):
+            self.mask |= 1 << self.ids[i]
+        self.size = mark
+
+    def copy(self):
+        deck = BitDeck.__new__(BitDeck)
+        deck.ids = self.ids[:]
+        deck.positions = self.positions[:]
+        deck.size = self.size
+        deck.mask = self.mask
+        deck.rng = self.rng
+        return deck
+
+
 class HandStrength(Enum):
     HIGH_CARD = auto()
     PAIR = auto()
@@ -110,13 +276,16 @@ class HandAnalysis:
     numberOfPairs: int = 0
     numberOfThreeOfKinds: int = 0
     flushSuit: str = ''
-    highCardInfo: list[str] = field(default_factory=list)
+    tempHighCardInfo: list[str] = field(default_factory=list)
     fiveCardHand: list[Card] = field(default_factory=list)
     cards: list[Card] = field(default_factory=list)
     draws_dict: dict = field(default_factory=dict)
 
 
-def get_hand_and_draws(cards):
+def get_hand_and_draws(cards, fast=False):
+    if fast:
+        return get_hand_and_draws_fast(cards)
+
     analysis = HandAnalysis()
 
     for card in cards:
@@ -132,19 +301,20 @@ def get_hand_and_draws(cards):
 
 def check_pair_etc(analysis):
     for card in analysis.cards:
-        number_of_matching_cards = analysis.cards.count(card)
+        number_of_matching_cards = count_matching(analysis.cards, card)
 
+        # every pair and trips is recorded, not only the ones that raise the hand, two pair and full house need them all
         if card.cardValue not in analysis.tempHighCardInfo:
             if number_of_matching_cards >= 2:
                 hand_dict = {2: HandStrength.PAIR, 3: HandStrength.THREE_OF_A_KIND, 4: HandStrength.FOUR_OF_A_KIND}
                 new_hand_name = hand_dict[number_of_matching_cards]
                 if analysis.handName is None or new_hand_name.value > analysis.handName.value:
                     analysis.handName = new_hand_name
-                    analysis.tempHighCardInfo.append(card.cardValue)
-                    if number_of_matching_cards == 2:
-                        analysis.numberOfPairs += 1
-                    elif number_of_matching_cards == 3:
-                        analysis.numberOfThreeOfKinds += 1
+                analysis.tempHighCardInfo.append(card.cardValue)
+                if number_of_matching_cards == 2:
+                    analysis.numberOfPairs += 1
+                elif number_of_matching_cards == 3:
+                    analysis.numberOfThreeOfKinds += 1
 
 
     return analysis
@@ -170,42 +340,52 @@ def check_straight_etc(analysis):
     add_draw(analysis, HandStrength.STRAIGHT_FLUSH, None)
     add_draw(analysis, HandStrength.ROYAL_FLUSH, None)
 
+    rank_mask = 0
+    flush_mask = 0
     for card in analysis.cards:
-        if card >= 10:
-            possible_straight = [10, 11, 12, 13, 14]
+        rank_mask |= 1 << card.numberValue - 2
+        if card.suit == analysis.flushSuit:
+            flush_mask |= 1 << card.numberValue - 2
+
+    straight_high = STRAIGHT_HIGH[rank_mask]
+    straight_flush_high = STRAIGHT_HIGH[flush_mask]
+    if straight_flush_high >= 0:
+        analysis.tempHighCardInfo = [straight_flush_high + 2]
+        add_draw(analysis, HandStrength.STRAIGHT, None)
+        if straight_flush_high == 12:
+            analysis.handName = HandStrength.ROYAL_FLUSH
+            add_draw(analysis, HandStrength.STRAIGHT_FLUSH, None)
         else:
-            possible_straight = [i for i in range(card.numberValue, card + 5)]
-
-        while card in possible_straight:
-            analysis, straight_matches, straight_flush_matches, straight_absences, straight_flush_absences = check_straight_instance(analysis,
-                                                                                                   possible_straight)
-            if straight_flush_matches == 5:
-                analysis.tempHighCardInfo = [possible_straight[-1]]
-                add_draw(analysis, HandStrength.STRAIGHT, None)
-                if analysis.tempHighCardInfo[0] == 14:
-                    analysis.handName = HandStrength.ROYAL_FLUSH
-                    add_draw(analysis, HandStrength.STRAIGHT_FLUSH, None)
-                else:
-                    analysis.handName = HandStrength.STRAIGHT_FLUSH
-            elif straight_matches == 5:
-                analysis.tempHighCardInfo = [possible_straight[-1]]
-                analysis.handName = HandStrength.STRAIGHT
-
-            add_straight_draws(analysis, possible_straight, straight_absences, straight_flush_absences,
-                               straight_flush_matches, straight_matches)
-
-            possible_straight = decrease_possible_straight(possible_straight)
+            analysis.handName = HandStrength.STRAIGHT_FLUSH
+    elif straight_high >= 0:
+        analysis.tempHighCardInfo = [straight_high + 2]
+        analysis.handName = HandStrength.STRAIGHT
+
+    # lowest window first, so a draw is only kept when it beats the made straight
+    for high, window in reversed(STRAIGHT_WINDOWS):
+        straight_matches = (rank_mask & window).bit_count()
+        straight_flush_matches = (flush_mask & window).bit_count()
+        if straight_matches == 4 or straight_flush_matches == 4:
+            possible_straight = list(range(high - 2, high + 3))
+            add_straight_draws(analysis, possible_straight, rank_mask_to_values(window & ~rank_mask),
+                               rank_mask_to_values(window & ~flush_mask), straight_flush_matches, straight_matches)
     return analysis
 
 
+def rank_mask_to_values(rank_mask):
+    return [ENGINE_VALUES[rank] for rank in range(13) if rank_mask >> rank & 1]
+
+
 def add_straight_draws(analysis, possible_straight, straight_absences, straight_flush_absences, straight_flush_matches,
                        straight_matches):
+    # a draw only beats a made straight when its window tops out higher, the added card's own value says
+    # nothing (the wheel's missing ace is a 5-high straight, not an ace-high one)
     if straight_flush_matches == 4:
         addition = Card(analysis.flushSuit, straight_flush_absences[0])
         if not analysis.tempHighCardInfo:
             analysis.tempHighCardInfo = [0]
         if (analysis.handName not in [HandStrength.STRAIGHT_FLUSH, HandStrength.ROYAL_FLUSH]
-                or addition.numberValue > analysis.tempHighCardInfo[0]
+                or possible_straight[-1] > analysis.tempHighCardInfo[0]
         ):
             if possible_straight[-1] == 14:
                 add_draw(analysis, HandStrength.ROYAL_FLUSH, addition)
@@ -216,7 +396,7 @@ def add_straight_draws(analysis, possible_straight, straight_absences, straight_
         if not analysis.tempHighCardInfo:
             analysis.tempHighCardInfo = [0]
         if (analysis.handName not in [HandStrength.STRAIGHT, HandStrength.STRAIGHT_FLUSH, HandStrength.ROYAL_FLUSH]
-                or Card('', addition).numberValue > analysis.tempHighCardInfo[0]
+                or possible_straight[-1] > analysis.tempHighCardInfo[0]
         ):
             add_draw(analysis, HandStrength.STRAIGHT, addition)
 
@@ -274,16 +454,16 @@ def find_pair(analysis):
     find_matching_cards(analysis, 2, analysis.tempHighCardInfo[0])
     add_draw(analysis, HandStrength.THREE_OF_A_KIND, analysis.tempHighCardInfo[0])
     for c in analysis.cards:
-        if c != analysis.tempHighCardInfo[0]:
+        if not c.matches(analysis.tempHighCardInfo[0]):
             add_draw(analysis, HandStrength.TWO_PAIR, c.cardValue)
 
 
 def find_two_pairs(analysis):
     analysis.handName = HandStrength.TWO_PAIR
     if analysis.numberOfPairs == 3:
-        analysis.tempHighCardInfo.remove(min(analysis.tempHighCardInfo))
-    high_pair = max(analysis.tempHighCardInfo)
-    low_pair = min(analysis.tempHighCardInfo)
+        analysis.tempHighCardInfo.remove(min(analysis.tempHighCardInfo, key=ENGINE_VALUES.index))
+    high_pair = max(analysis.tempHighCardInfo, key=ENGINE_VALUES.index)
+    low_pair = min(analysis.tempHighCardInfo, key=ENGINE_VALUES.index)
     analysis.tempHighCardInfo = [high_pair, low_pair]
     for pairValue in analysis.tempHighCardInfo:
         find_matching_cards(analysis, 2, pairValue)
@@ -296,9 +476,11 @@ def find_three_of_kind(analysis):
 
 
 def find_flush(analysis):
+    # a pair or straight found earlier says nothing about the flush, finalize_analysis reads its top card
+    analysis.tempHighCardInfo = []
     for _ in range(2):
         for card in analysis.cards:
-            if card != analysis.flushSuit:
+            if card.suit != analysis.flushSuit:
                 move_card(analysis, analysis.cards.index(card), False)
 
 
@@ -307,43 +489,47 @@ def find_full_house(analysis):
     pairs = []
     three_of_kinds = []
     for value in analysis.tempHighCardInfo:
-        if analysis.cards.count(value) == 3:
+        if count_matching(analysis.cards, value) == 3:
             three_of_kinds.append(value)
         else:
             pairs.append(value)
-    the_three_of_kind = max(three_of_kinds)
+    # rank letters order by ENGINE_VALUES, compared as strings 'T' would beat 'A'
+    the_three_of_kind = max(three_of_kinds, key=ENGINE_VALUES.index)
     if pairs:
-        the_pair = max(pairs)
+        the_pair = max(pairs, key=ENGINE_VALUES.index)
     else:
-        the_pair = min(three_of_kinds)
+        the_pair = min(three_of_kinds, key=ENGINE_VALUES.index)
     find_matching_cards(analysis, 3, the_three_of_kind)
     find_matching_cards(analysis, 2, the_pair)
     add_draw(analysis, HandStrength.FOUR_OF_A_KIND, the_three_of_kind)
-    if the_pair > the_three_of_kind:
+    if ENGINE_VALUES.index(the_pair) > ENGINE_VALUES.index(the_three_of_kind):
         add_draw(analysis, HandStrength.FULL_HOUSE, the_pair)
-    analysis.tempHighCardInfo = three_of_kinds + pairs
+    analysis.tempHighCardInfo = [the_three_of_kind, the_pair]
 
 
 def find_four_of_kind(analysis, the_fok):
     for value in analysis.tempHighCardInfo:
-        if analysis.cards.count(value) == 4:
+        if count_matching(analysis.cards, value) == 4:
             the_fok = value
     find_matching_cards(analysis, 4, the_fok)
+    analysis.tempHighCardInfo = [the_fok]
 
 
 def find_straight(analysis, flush=False):
     straight_high_card = int(analysis.tempHighCardInfo[0])
     current_value = straight_high_card
 
+    # for a straight flush the card has to be of the flush suit too, the first card of the rank may not be
     while current_value > straight_high_card - 5 and current_value > 1:
-        i = analysis.cards.index(current_value)
-        if analysis.cards[i] == analysis.flushSuit or not flush:
-            move_card(analysis, i)
-            current_value -= 1
+        i = next(i for i, card in enumerate(analysis.cards)
+                 if card.matches(current_value) and (card.suit == analysis.flushSuit or not flush))
+        move_card(analysis, i)
+        current_value -= 1
 
-    if current_value == 1:
+    # only a five high straight uses the ace, a six high one also runs down to 1
+    if straight_high_card == 5:
         for i, value in enumerate(analysis.cards):
-            if value.cardValue == 'A' and (analysis.cards[i] == analysis.flushSuit or not flush):
+            if value.cardValue == 'A' and (analysis.cards[i].suit == analysis.flushSuit or not flush):
                 move_card(analysis, i)
                 break
 
@@ -361,7 +547,7 @@ def move_card(analysis, current_index, add_to_hand=True):
 
 def find_matching_cards(analysis, count, card):
     for _ in range(count):
-        move_card(analysis, analysis.cards.index(card))
+        move_card(analysis, index_matching(analysis.cards, card))
     return analysis
 
 
@@ -392,39 +578,6 @@ def finalize_analysis(analysis):
     return analysis
 
 
-def check_straight_instance(analysis, possible_straight):
-    straight_matches = 0
-    straight_flush_matches = 0
-    straight_absences = []
-    straight_flush_absences = []
-    for possible_value in possible_straight:
-        found_for_straight = False
-        found_for_straight_flush = False
-        for i, c in enumerate(analysis.cards):
-            if c == possible_value or (c == 'A' and possible_value == 1):
-                if not found_for_straight:
-                    found_for_straight = True
-                    straight_matches += 1
-                if analysis.cards[i] == analysis.flushSuit:
-                    found_for_straight_flush = True
-                    straight_flush_matches += 1
-        if not found_for_straight:
-            straight_absences.append(get_card_value(possible_value))
-        if not found_for_straight_flush:
-            straight_flush_absences.append(get_card_value(possible_value))
-    return analysis, straight_matches, straight_flush_matches, straight_absences, straight_flush_absences
-
-
-def decrease_possible_straight(possible_straight):
-    if possible_straight[0] == 1:
-        return [None for _ in range(5)]
-    else:
-        out_straight = []
-        for v in possible_straight:
-                out_straight.append(v-1)
-        return out_straight
-
-
 def get_card_value(number_value: int) -> str:
     face_cards = {11: 'J', 12: 'Q', 13: 'K', 14: 'A'}
     if number_value <= 10:
@@ -433,8 +586,21 @@ def get_card_value(number_value: int) -> str:
         return face_cards[number_value]
 
 
-def display_probabilities(draws_dict, deck, hand_name):
+def display_probabilities(draws_dict, deck, hand_name, cards=None, show=True):
+    # with the hand's cards every remaining river card is evaluated exactly and the deck is left alone,
+    # without them the outs in draws_dict are counted against (and removed from) the deck
     number_of_cards = len(deck)
+    if cards is not None:
+        output_dict = river_distribution(cards, deck)
+    else:
+        output_dict = count_outs(draws_dict, deck, hand_name, number_of_cards)
+
+    if show:
+        print_probabilities(output_dict, number_of_cards)
+    return output_dict
+
+
+def count_outs(draws_dict, deck, hand_name, number_of_cards):
     output_dict = {}
     all_outs = 0
 
@@ -446,15 +612,17 @@ def display_probabilities(draws_dict, deck, hand_name):
                 outs = 0
                 if outs_list:
                     for datum in outs_list:
-                        if isinstance(datum, Card):
-                            datum.suitMatters = True
-                        outs += deck.count_and_remove(datum)
+                        # a Card out is that exact card, a str out is every card of that rank or suit
+                        outs += deck.count_and_remove(datum, suit_matters=isinstance(datum, Card))
                     all_outs += outs
                 output_dict[drawName] = outs
         strength -= 1
 
     output_dict[hand_name] += number_of_cards - all_outs
+    return output_dict
+
 
+def print_probabilities(output_dict, number_of_cards):
     strength = 10
     while strength > 0:
         for key in output_dict:
@@ -472,7 +640,456 @@ def add_draw(analysis, key, addition):
     return analysis
 
 
-def main(cheating=False):
+RANK_MASK = (1 << 13) - 1
+FULL_DECK_MASK = (1 << 52) - 1
+RANK_COLUMN = 1 | 1 << 13 | 1 << 26 | 1 << 39
+
+HAND_NAMES = (None,) + tuple(HandStrength)
+CARDS_PER_CATEGORY = {
+    HandStrength.HIGH_CARD: (1, 1, 1, 1, 1),
+    HandStrength.PAIR: (2, 1, 1, 1),
+    HandStrength.TWO_PAIR: (2, 2, 1),
+    HandStrength.THREE_OF_A_KIND: (3, 1, 1),
+    HandStrength.FULL_HOUSE: (3, 2),
+    HandStrength.FOUR_OF_A_KIND: (4, 1),
+}
+
+
+def card_to_int(card: Card) -> int:
+    return card.cardId
+
+
+def int_to_card(card_id: int) -> Card:
+    return Card.by_id[card_id]
+
+
+def cards_to_mask(card_ids) -> int:
+    mask = 0
+    for card_id in card_ids:
+        mask |= 1 << card_id
+    return mask
+
+
+def build_straight_table():
+    # windows are (high rank_index, 13-bit window), best first with the wheel last
+    windows = [(high, 0x1F << (high - 4)) for high in range(12, 3, -1)]
+    windows.append((3, 0x100F))
+
+    table = [-1] * (1 << 13)
+    for rank_mask in range(1 << 13):
+        for high, window in windows:
+            if rank_mask & window == window:
+                table[rank_mask] = high
+                break
+    return windows, table
+
+
+STRAIGHT_WINDOWS, STRAIGHT_HIGH = build_straight_table()
+
+
+def build_straight_outs_table():
+    # for every rank mask, the ranks whose arrival makes a straight or a higher straight
+    table = [0] * (1 << 13)
+    for rank_mask in range(1 << 13):
+        for rank in range(13):
+            if STRAIGHT_HIGH[rank_mask | 1 << rank] > STRAIGHT_HIGH[rank_mask]:
+                table[rank_mask] |= 1 << rank
+    return table
+
+
+STRAIGHT_OUTS = build_straight_outs_table()
+# the rank letters of every rank mask, highest first
+RANK_LETTERS = [''.join(ENGINE_VALUES[rank] for rank in range(12, -1, -1) if rank_mask >> rank & 1)
+                for rank_mask in range(1 << 13)]
+
+
+def top_ranks(rank_mask: int, count: int) -> list[int]:
+    ranks = []
+    while rank_mask and len(ranks) < count:
+        rank = rank_mask.bit_length() - 1
+        ranks.append(rank)
+        rank_mask ^= 1 << rank
+    return ranks
+
+
+def pack_strength(hand_name: HandStrength, ranks) -> int:
+    # category in the top bits, then up to five numberValues one nibble each, so bigger is better
+    value = hand_name.value
+    for i in range(5):
+        value = value << 4 | (ranks[i] + 2 if i < len(ranks) else 0)
+    return value
+
+
+def strength_to_hand(value: int) -> HandStrength:
+    return HAND_NAMES[value >> 20]
+
+
+def strength_to_values(value: int) -> list[int]:
+    values = [value >> shift & 0xF for shift in (16, 12, 8, 4, 0)]
+    return [v for v in values if v]
+
+
+def evaluate_mask(mask: int) -> int:
+    s0 = mask & RANK_MASK
+    s1 = mask >> 13 & RANK_MASK
+    s2 = mask >> 26 & RANK_MASK
+    s3 = mask >> 39 & RANK_MASK
+    twos = (s0 & s1) | (s0 & s2) | (s0 & s3) | (s1 & s2) | (s1 & s3) | (s2 & s3)
+    threes = (s0 & s1 & (s2 | s3)) | (s2 & s3 & (s0 | s1))
+    return evaluate_rank_masks((s0, s1, s2, s3), s0 | s1 | s2 | s3, twos, threes, s0 & s1 & s2 & s3)
+
+
+def evaluate_rank_masks(suit_masks, ranks, twos, threes, fours) -> int:
+    # twos/threes/fours are the ranks held at least 2/3/4 times
+    straight_flush_high = -1
+    flush_ranks = 0
+    for suit_ranks in suit_masks:
+        if suit_ranks.bit_count() >= 5:
+            straight_flush_high = max(straight_flush_high, STRAIGHT_HIGH[suit_ranks])
+            flush_ranks = max(flush_ranks, sum(1 << r for r in top_ranks(suit_ranks, 5)))
+
+    if straight_flush_high == 12:
+        return pack_strength(HandStrength.ROYAL_FLUSH, [12])
+    if straight_flush_high >= 0:
+        return pack_strength(HandStrength.STRAIGHT_FLUSH, [straight_flush_high])
+
+    if fours:
+        quad = fours.bit_length() - 1
+        return pack_strength(HandStrength.FOUR_OF_A_KIND, [quad] + top_ranks(ranks ^ 1 << quad, 1))
+
+    trips = threes.bit_length() - 1
+    if threes and twos ^ 1 << trips:
+        pair = (twos ^ 1 << trips).bit_length() - 1
+        return pack_strength(HandStrength.FULL_HOUSE, [trips, pair])
+
+    if flush_ranks:
+        return pack_strength(HandStrength.FLUSH, top_ranks(flush_ranks, 5))
+
+    if STRAIGHT_HIGH[ranks] >= 0:
+        return pack_strength(HandStrength.STRAIGHT, [STRAIGHT_HIGH[ranks]])
+
+    if threes:
+        return pack_strength(HandStrength.THREE_OF_A_KIND, [trips] + top_ranks(ranks ^ 1 << trips, 2))
+
+    if twos:
+        high_pair = twos.bit_length() - 1
+        low_pairs = twos ^ 1 << high_pair
+        if low_pairs:
+            low_pair = low_pairs.bit_length() - 1
+            kickers = top_ranks(ranks ^ 1 << high_pair ^ 1 << low_pair, 1)
+            return pack_strength(HandStrength.TWO_PAIR, [high_pair, low_pair] + kickers)
+        return pack_strength(HandStrength.PAIR, [high_pair] + top_ranks(ranks ^ 1 << high_pair, 3))
+
+    return pack_strength(HandStrength.HIGH_CARD, top_ranks(ranks, 5))
+
+
+def evaluate_cards(card_ids) -> int:
+    return evaluate_mask(cards_to_mask(card_ids))
+
+
+def select_five_card_hand(value, cards_by_id):
+    hand_name = strength_to_hand(value)
+    values = strength_to_values(value)
+
+    if hand_name in [HandStrength.STRAIGHT, HandStrength.FLUSH, HandStrength.STRAIGHT_FLUSH,
+                     HandStrength.ROYAL_FLUSH]:
+        if hand_name != HandStrength.FLUSH:
+            values = [14 if v == 1 else v for v in range(values[0], values[0] - 5, -1)]
+        suits = range(4)
+        if hand_name != HandStrength.STRAIGHT:
+            suits = [s for s in suits if all(s * 13 + v - 2 in cards_by_id for v in values)][:1]
+        return [next(cards_by_id[s * 13 + v - 2] for s in suits if s * 13 + v - 2 in cards_by_id) for v in values]
+
+    # one pass over the cards, each one goes to the group of its rank until that group is full
+    counts = CARDS_PER_CATEGORY[hand_name]
+    groups = [[] for _ in counts]
+    position = {v - 2: i for i, v in enumerate(values)}
+    for card_id, card in cards_by_id.items():
+        i = position.get(card_id % 13)
+        if i is not None and len(groups[i]) < counts[i]:
+            groups[i].append(card)
+    return [card for group in groups for card in group]
+
+
+def high_card_info_from_strength(value) -> list[str]:
+    # the object engine's tokens: ranks it reads off paired cards are card letters, a high card it works
+    # out as a number (high card, straights, flushes) goes through get_card_value, so a ten is '10' there
+    hand_name = strength_to_hand(value)
+    if hand_name == HandStrength.ROYAL_FLUSH:
+        return []
+    if hand_name in [HandStrength.HIGH_CARD, HandStrength.STRAIGHT, HandStrength.FLUSH, HandStrength.STRAIGHT_FLUSH]:
+        return [get_card_value(value >> 16 & 0xF)]
+    high = ENGINE_VALUES[(value >> 16 & 0xF) - 2]
+    if hand_name in [HandStrength.TWO_PAIR, HandStrength.FULL_HOUSE]:
+        return [high, ENGINE_VALUES[(value >> 12 & 0xF) - 2]]
+    return [high]
+
+
+def river_categories(mask, remaining_mask):
+    # only suits with four or more cards can turn a river card into a flush, every other suit
+    # gives the same category for a given rank, so each rank is evaluated at most 1 + flush suits times
+    suit_counts = [(mask >> 13 * s & RANK_MASK).bit_count() for s in range(4)]
+    unseen = remaining_mask & ~mask
+    categories = {}
+    for rank in range(13):
+        shared_category = None
+        for suit in range(4):
+            card_id = suit * 13 + rank
+            if not unseen >> card_id & 1:
+                continue
+            if suit_counts[suit] >= 4:
+                categories[card_id] = evaluate_mask(mask | 1 << card_id) >> 20
+            else:
+                if shared_category is None:
+                    shared_category = evaluate_mask(mask | 1 << card_id) >> 20
+                categories[card_id] = shared_category
+    return categories
+
+
+def river_distribution(cards, deck=None) -> dict[HandStrength, int]:
+    mask = cards_to_mask(card_to_int(card) for card in cards)
+    if deck is None:
+        remaining_mask = FULL_DECK_MASK
+    elif isinstance(deck, BitDeck):
+        remaining_mask = deck.mask
+    else:
+        remaining_mask = cards_to_mask(card_to_int(card) for card in deck.cards)
+
+    output_dict = {}
+    for category in river_categories(mask, remaining_mask).values():
+        hand_name = HandStrength(category)
+        output_dict[hand_name] = output_dict.get(hand_name, 0) + 1
+    return output_dict
+
+
+def find_draws_fast(mask, hand_name=None):
+    # draws use the same tokens as the object engine: a suit letter or rank letter stands for every
+    # remaining card of that suit/rank, a Card for one exact card. display_probabilities removes outs
+    # strongest first, so a token may also cover cards already claimed by a stronger draw.
+    # Everything comes from the rank masks (twos/threes/fours are the ranks held at least 2/3/4 times)
+    # and the suits holding four cards, no river card is evaluated.
+    s0, s1, s2, s3 = suit_masks = [mask >> 13 * s & RANK_MASK for s in range(4)]
+    ranks = s0 | s1 | s2 | s3
+    twos = (s0 & s1) | (s0 & s2) | (s0 & s3) | (s1 & s2) | (s1 & s3) | (s2 & s3)
+    threes = (s0 & s1 & (s2 | s3)) | (s2 & s3 & (s0 | s1))
+    fours = s0 & s1 & s2 & s3
+    if hand_name is None:
+        hand_name = strength_to_hand(evaluate_rank_masks(suit_masks, ranks, twos, threes, fours))
+    current = hand_name.value
+
+    # the ranks whose river card reaches each category, whatever its suit
+    pair_count = twos.bit_count()
+    if fours or threes and (threes.bit_count() > 1 or pair_count > 1):
+        full_house = RANK_MASK
+    elif threes:
+        full_house = ranks ^ threes
+    else:
+        full_house = twos if pair_count > 1 else 0
+    reaching = [0] * 11
+    reaching[8] = RANK_MASK if fours else threes
+    reaching[7] = full_house
+    reaching[5] = RANK_MASK if STRAIGHT_HIGH[ranks] >= 0 else STRAIGHT_OUTS[ranks]
+    reaching[4] = RANK_MASK if threes else twos
+    reaching[3] = RANK_MASK if pair_count > 1 else ranks & ~twos if twos else 0
+    reaching[2] = RANK_MASK if twos else ranks
+
+    # a card of a four card suit makes at least a flush: straight flush (and royal) cards are outs on
+    # their own, a higher straight flush included, the rest are the suit's flush outs unless their rank
+    # already gives a full house or better
+    outs = {}
+    unseen = 0
+    flush_only = 0
+    for s, suit_ranks in enumerate(suit_masks):
+        if suit_ranks.bit_count() < 4:
+            unseen |= RANK_MASK & ~suit_ranks
+            continue
+        straight_flush_ranks = STRAIGHT_OUTS[suit_ranks]
+        for rank in top_ranks(straight_flush_ranks, 13):
+            strength = 10 if STRAIGHT_HIGH[suit_ranks | 1 << rank] == 12 else 9
+            outs.setdefault(strength, []).append(int_to_card(s * 13 + rank))
+        suit_flush_only = RANK_MASK & ~suit_ranks & ~straight_flush_ranks
+        if suit_flush_only & ~(reaching[8] | reaching[7]):
+            outs.setdefault(6, []).append(ENGINE_SUITS[s])
+        flush_only |= suit_flush_only
+
+    # a rank token needs a card of exactly that category left: one outside the four card suits, or a
+    # flush-only card of a rank that makes a full house or quads anyway
+    available = unseen | flush_only & (reaching[8] | reaching[7])
+    claimed = 0
+    for strength in (8, 7, 5, 4, 3, 2):
+        if strength <= current:
+            break
+        letters = RANK_LETTERS[reaching[strength] & ~claimed & available]
+        claimed |= reaching[strength]
+        if letters:
+            outs.setdefault(strength, []).extend(letters)
+
+    # like the object engine, the made hand's own draw lists the ranks that beat it without changing the
+    # category: a higher straight, or a pair above the trips of a full house
+    if current == HandStrength.STRAIGHT.value:
+        upgrades = STRAIGHT_OUTS[ranks]
+    elif current == HandStrength.FULL_HOUSE.value and not fours:
+        upgrades = twos & ~threes & ~((1 << threes.bit_length()) - 1)
+    else:
+        upgrades = 0
+    if upgrades & ~claimed & available:
+        outs.setdefault(current, []).extend(RANK_LETTERS[upgrades & ~claimed & available])
+
+    draws_dict = {HAND_NAMES[strength]: outs[strength] for strength in sorted(outs, reverse=True) if strength > current}
+    draws_dict[hand_name] = outs.get(current, [])
+    return draws_dict
+
+
+def get_hand_and_draws_fast(cards):
+    cards_by_id = {card_to_int(card): card for card in cards}
+    mask = cards_to_mask(cards_by_id)
+    value = evaluate_mask(mask)
+    hand_name = strength_to_hand(value)
+
+    result = (hand_name, high_card_info_from_strength(value), select_five_card_hand(value, cards_by_id))
+    return result, find_draws_fast(mask, hand_name)
+
+
+@lru_cache(maxsize=None)
+def combination_indexes(n: int, k: int) -> tuple[tuple[int, ...], ...]:
+    return tuple(combinations(range(n), k))
+
+
+def best_omaha_strength(hole_ids, board_ids, hole_used=2, board_used=3):
+    # exactly hole_used cards from the hand and board_used from the board, every pairing scored once
+    if len(hole_ids) < hole_used or len(board_ids) < board_used:
+        raise ValueError(f'an omaha hand needs at least {hole_used} hole cards and {board_used} board cards, '
+                         f'got {len(hole_ids)} and {len(board_ids)}')
+    hole_masks = [cards_to_mask(hole_ids[i] for i in indexes)
+                  for indexes in combination_indexes(len(hole_ids), hole_used)]
+    board_masks = [cards_to_mask(board_ids[i] for i in indexes)
+                   for indexes in combination_indexes(len(board_ids), board_used)]
+
+    best_value = 0
+    best_mask = 0
+    for hole_mask in hole_masks:
+        for board_mask in board_masks:
+            value = evaluate_mask(hole_mask | board_mask)
+            if value > best_value:
+                best_value, best_mask = value, hole_mask | board_mask
+    return best_value, best_mask
+
+
+def get_omaha_hand(hole_cards, board):
+    cards_by_id = {card_to_int(card): card for card in list(hole_cards) + list(board)}
+    value, best_mask = best_omaha_strength([card_to_int(c) for c in hole_cards], [card_to_int(c) for c in board])
+    five_cards_by_id = {card_id: card for card_id, card in cards_by_id.items() if best_mask >> card_id & 1}
+    return strength_to_hand(value), high_card_info_from_strength(value), select_five_card_hand(value, five_cards_by_id)
+
+
+def omaha_river_distribution(hole_cards, board, deck=None) -> dict[HandStrength, int]:
+    hole_ids = [card_to_int(card) for card in hole_cards]
+    board_ids = [card_to_int(card) for card in board]
+    used = cards_to_mask(hole_ids + board_ids)
+    if deck is None:
+        remaining_mask = FULL_DECK_MASK
+    elif isinstance(deck, BitDeck):
+        remaining_mask = deck.mask
+    else:
+        remaining_mask = cards_to_mask(card_to_int(card) for card in deck.cards)
+
+    output_dict = {}
+    for card_id in range(52):
+        if remaining_mask >> card_id & 1 and not used >> card_id & 1:
+            hand_name = strength_to_hand(best_omaha_strength(hole_ids, board_ids + [card_id])[0])
+            output_dict[hand_name] = output_dict.get(hand_name, 0) + 1
+    return output_dict
+
+
+PROFILED_PHASES = ['check_pair_etc', 'check_straight_and_flush', 'find_5_card_hand', 'finalize_analysis',
+                   'evaluate_mask', 'select_five_card_hand', 'find_draws_fast']
+PROFILED_BRANCHES = ['find_straight', 'find_four_of_kind', 'find_full_house', 'find_flush', 'find_three_of_kind',
+                     'find_two_pairs', 'find_pair', 'find_high_card']
+PROFILED_COMPARISONS = ['__eq__', 'matches', '__gt__', '__ge__']
+
+
+class PhaseProfiler:
+    # Opt-in instrumentation. enable() swaps the module level phase functions and the Card comparison
+    # methods for timed/counting wrappers and disable() puts the originals back, so nothing is wrapped
+    # (and nothing is paid) while profiling is off.
+    def __init__(self):
+        self.calls = Counter()
+        self.seconds = defaultdict(float)
+        self.card_comparisons = Counter()
+        self.originals = {}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.originals)
+
+    def wrap_phase(self, name, function):
+        calls, seconds, clock = self.calls, self.seconds, time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds[name] += clock() - start
+                calls[name] += 1
+        return timed
+
+    def wrap_comparison(self, name, method):
+        comparisons = self.card_comparisons
+
+        def counted(card, other):
+            comparisons[name] += 1
+            return method(card, other)
+        return counted
+
+    def enable(self):
+        if self.enabled:
+            return self
+        module_globals = globals()
+        for name in PROFILED_PHASES + PROFILED_BRANCHES:
+            self.originals[name] = module_globals[name]
+            module_globals[name] = self.wrap_phase(name, self.originals[name])
+        for name in PROFILED_COMPARISONS:
+            self.originals[f'Card.{name}'] = getattr(Card, name)
+            setattr(Card, name, self.wrap_comparison(name, self.originals[f'Card.{name}']))
+        return self
+
+    def disable(self):
+        module_globals = globals()
+        for name, original in self.originals.items():
+            if name.startswith('Card.'):
+                setattr(Card, name[len('Card.'):], original)
+            else:
+                module_globals[name] = original
+        self.originals = {}
+
+    def reset(self):
+        self.calls.clear()
+        self.seconds.clear()
+        self.card_comparisons.clear()
+
+    def __enter__(self):
+        return self.enable()
+
+    def __exit__(self, *exc_info):
+        self.disable()
+
+    def summary(self) -> dict:
+        def section(names):
+            return {name: {'calls': self.calls[name], 'seconds': self.seconds[name]}
+                    for name in names if self.calls[name]}
+
+        return {'phases': section(PROFILED_PHASES), 'branches': section(PROFILED_BRANCHES),
+                'card_comparisons': dict(self.card_comparisons),
+                'total_card_comparisons': sum(self.card_comparisons.values())}
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.summary(), **kwargs)
+
+
+def main(cheating=False, hole_count=None, board_count=4, omaha=False):
+    if hole_count is None:
+        hole_count = 4 if omaha else 2
     suits = ['h', 's', 'c', 'd']
     values = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
 
@@ -485,10 +1102,13 @@ def main(cheating=False):
         turn = [deck.deal('c', '3'), deck.deal('c', '4'), deck.deal('c', '5'),
                 deck.deal('h', '4')]
     else:
-        two_card_hand = [deck.deal(), deck.deal()]
-        turn = [deck.deal() for _ in range(4)]
+        two_card_hand = [deck.deal() for _ in range(hole_count)]
+        turn = [deck.deal() for _ in range(board_count)]
 
-    result, draws_dict = get_hand_and_draws(two_card_hand + turn)
+    if omaha:
+        result = get_omaha_hand(two_card_hand, turn)
+    else:
+        result, draws_dict = get_hand_and_draws(two_card_hand + turn, fast=True)
     hand_name = result[0]
 
     print('Turn\n'
@@ -498,7 +1118,10 @@ def main(cheating=False):
           'Result\n'
           f'{result}\n')
 
-    display_probabilities(draws_dict, deck, hand_name)
+    if omaha:
+        print_probabilities(omaha_river_distribution(two_card_hand, turn, deck), len(deck))
+    else:
+        display_probabilities(draws_dict, deck, hand_name)
 
 
 if __name__ == '__main__':
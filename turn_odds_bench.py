@@ -0,0 +1,413 @@
+import argparse
+import itertools
+import json
+import random
+import signal
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from turn_odds import (BitDeck, Card, HandAnalysis, HandStrength, card_to_int, check_pair_etc, check_straight_and_flush,
+                       display_probabilities, evaluate_cards, finalize_analysis, find_5_card_hand,
+                       get_hand_and_draws, high_card_info_from_strength, int_to_card, pack_strength, river_distribution, strength_to_hand)
+from incremental import IncrementalHand
+
+# Benchmark and correctness harness for the turn_odds evaluators. Every corpus is built from a fixed
+# seed so timings and failures are comparable between runs, and every engine is checked against
+# reference_evaluate, a deliberately simple best-of-all-five-card-subsets evaluator. main exits with
+# status 1 when anything disagrees with it.
+
+SUITS = ['h', 's', 'c', 'd']
+VALUES = ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
+
+# (cards, draw, outs) get_hand_and_draws has to keep reporting, cards as 'value+suit' text
+DRAW_REGRESSIONS = [
+    # a made 3-7 straight is only beaten by the 8, the wheel window's missing ace makes a 5-high straight
+    ('4d 3d 6d 7s 5s 2d', HandStrength.STRAIGHT, ['8']),
+    ('3h 4h 5h 6h 7h 2h', HandStrength.STRAIGHT_FLUSH, ['8h']),
+    ('2h 3h 4h 5h Kc Kd', HandStrength.STRAIGHT, ['A', '6']),
+]
+
+# seconds each object engine hand gets, so a hand that stops terminating fails instead of hanging the run
+LEGACY_TIMEOUT = 1.0
+
+LEGACY_PHASES = [
+    ('check_pair_etc', check_pair_etc),
+    ('check_straight_and_flush', check_straight_and_flush),
+    ('find_5_card_hand', find_5_card_hand),
+    ('finalize_analysis', finalize_analysis),
+]
+
+
+def reference_rank_5(card_ids):
+    ranks = sorted((card_id % 13 for card_id in card_ids), reverse=True)
+    counts = Counter(ranks)
+    groups = sorted(counts.items(), key=lambda item: (item[1], item[0]), reverse=True)
+    by_group = [rank for rank, _ in groups]
+    is_flush = len({card_id // 13 for card_id in card_ids}) == 1
+
+    straight_high = None
+    if len(counts) == 5:
+        if ranks[0] - ranks[4] == 4:
+            straight_high = ranks[0]
+        elif ranks == [12, 3, 2, 1, 0]:
+            straight_high = 3
+
+    if straight_high is not None and is_flush:
+        hand_name = HandStrength.ROYAL_FLUSH if straight_high == 12 else HandStrength.STRAIGHT_FLUSH
+        return pack_strength(hand_name, [straight_high])
+    if groups[0][1] == 4:
+        return pack_strength(HandStrength.FOUR_OF_A_KIND, by_group)
+    if groups[0][1] == 3 and groups[1][1] == 2:
+        return pack_strength(HandStrength.FULL_HOUSE, by_group)
+    if is_flush:
+        return pack_strength(HandStrength.FLUSH, ranks)
+    if straight_high is not None:
+        return pack_strength(HandStrength.STRAIGHT, [straight_high])
+    if groups[0][1] == 3:
+        return pack_strength(HandStrength.THREE_OF_A_KIND, by_group)
+    if groups[0][1] == 2 and groups[1][1] == 2:
+        return pack_strength(HandStrength.TWO_PAIR, by_group)
+    if groups[0][1] == 2:
+        return pack_strength(HandStrength.PAIR, by_group)
+    return pack_strength(HandStrength.HIGH_CARD, ranks)
+
+
+def reference_evaluate(card_ids):
+    return max(reference_rank_5(five) for five in itertools.combinations(card_ids, 5))
+
+
+def random_spots(count, size=6, seed=0):
+    rng = random.Random(seed)
+    return [rng.sample(range(52), size) for _ in range(count)]
+
+
+def edge_case_spots(seed=0):
+    # every straight and straight flush window (wheel included), big flushes, quads, boats and the
+    # three pair hands find_two_pairs special cases, each padded with random non-interfering cards
+    rng = random.Random(seed)
+    spots = []
+    windows = [[(high - i) % 13 for i in range(5)] for high in range(3, 13)]
+    for ranks in windows:
+        for suit in range(4):
+            spots.append([suit * 13 + r for r in ranks])
+            spots.append([(suit + i) % 4 * 13 + r for i, r in enumerate(ranks)])
+    for spot in list(spots):
+        for _ in range(2):
+            extra = rng.sample([c for c in range(52) if c not in spot], 2)
+            spots.append(spot + extra[:1])
+            spots.append(spot + extra)
+
+    wheel = [12, 0, 1, 2, 3]
+    spots.append(wheel + [4])
+    spots.append(wheel + [13 + 4, 26 + 12])
+    for suit in range(4):
+        suited = rng.sample(range(13), 7)
+        spots.append([suit * 13 + r for r in suited[:6]])
+        spots.append([suit * 13 + r for r in suited])
+    for rank in range(13):
+        quads = [s * 13 + rank for s in range(4)]
+        spots.append(quads + rng.sample([c for c in range(52) if c not in quads], 2))
+    for _ in range(40):
+        pair_ranks = rng.sample(range(13), 4)
+        three_pair = [s * 13 + r for r in pair_ranks[:3] for s in rng.sample(range(4), 2)]
+        spots.append(three_pair)
+        spots.append(three_pair + [rng.randrange(4) * 13 + pair_ranks[3]])
+        trips = [s * 13 + r for r in pair_ranks[:2] for s in rng.sample(range(4), 3)]
+        spots.append(trips + [rng.randrange(4) * 13 + pair_ranks[2]])
+    return spots
+
+
+def default_corpora(count, seed):
+    return {
+        'random_6': random_spots(count, 6, seed),
+        'random_7': random_spots(count, 7, seed + 1),
+        'edge_cases': edge_case_spots(seed),
+    }
+
+
+def incremental_evaluate(card_ids):
+    return IncrementalHand(card_ids).strength()
+
+
+def engines():
+    engine_dict = {'bitmask': evaluate_cards, 'incremental': incremental_evaluate}
+    try:
+        from rank_tables import load_rank_tables
+        tables = load_rank_tables()
+        engine_dict['rank_tables'] = lambda card_ids: tables.strength(tables.rank(card_ids))
+    except OSError:
+        pass
+    return engine_dict
+
+
+def cross_check(evaluate, spots, limit=20):
+    failures = []
+    for spot in spots:
+        expected = reference_evaluate(spot)
+        got = evaluate(spot)
+        if got != expected:
+            failures.append({'cards': [repr(int_to_card(c)) for c in spot], 'expected': expected, 'got': got})
+            if len(failures) >= limit:
+                break
+    return failures
+
+
+class HandTimeout(Exception):
+    pass
+
+
+@contextmanager
+def time_limit(seconds):
+    # SIGALRM based, so there is no limit on platforms without setitimer
+    if not seconds or not hasattr(signal, 'setitimer'):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise HandTimeout(f'no result after {seconds}s')
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def hand_cross_check(get_hand, card_spots, limit=20, timeout=None):
+    # get_hand returns get_hand_and_draws' (hand name, high card info, five card hand): the hand name has
+    # to be the reference category, the high card info the reference's and the five cards, all from the
+    # spot, have to be worth the reference
+    counts = Counter()
+    examples = []
+    for cards in card_spots:
+        card_ids = [card_to_int(card) for card in cards]
+        expected = reference_evaluate(card_ids)
+        try:
+            with time_limit(timeout):
+                hand_name, high_card_info, five_card_hand = get_hand(cards)
+        except HandTimeout as error:
+            outcome, got = 'timeouts', str(error)
+        except Exception as error:
+            outcome, got = 'errors', f'{type(error).__name__}: {error}'
+        else:
+            five_ids = [card_to_int(card) for card in five_card_hand]
+            if (hand_name == strength_to_hand(expected) and high_card_info == high_card_info_from_strength(expected)
+                    and len(set(five_ids)) == 5 and set(five_ids) <= set(card_ids)
+                    and reference_evaluate(five_ids) == expected):
+                continue
+            outcome, got = 'wrong', f'{hand_name.name} {high_card_info} {five_card_hand}'
+        counts[outcome] += 1
+        if len(examples) < limit:
+            examples.append({'cards': [repr(card) for card in cards], 'expected': strength_to_hand(expected).name,
+                             'outcome': outcome, 'got': got})
+    return {'hands': len(card_spots), 'wrong': counts['wrong'], 'errors': counts['errors'],
+            'timeouts': counts['timeouts'], 'examples': examples}
+
+
+def outs_cross_check(card_spots, limit=20):
+    # the fast engine's draws, counted strongest first the way display_probabilities does, have to give
+    # exactly the river_distribution odds
+    failures = []
+    for cards in card_spots:
+        (hand_name, _, _), draws_dict = get_hand_and_draws(cards, fast=True)
+        deck = BitDeck(SUITS, VALUES)
+        for card in cards:
+            deck.deal_id(card_to_int(card))
+        counted = display_probabilities(draws_dict, deck, hand_name, show=False)
+        counted = {name.name: count for name, count in counted.items() if count}
+        exact = {name.name: count for name, count in river_distribution(cards).items()}
+        if counted != exact:
+            failures.append({'cards': [repr(card) for card in cards], 'expected': exact, 'got': counted})
+            if len(failures) >= limit:
+                break
+    return failures
+
+
+def check_draw_regressions(fast=False):
+    failures = []
+    for text, draw, expected in DRAW_REGRESSIONS:
+        cards = [Card(token[1], token[0]) for token in text.split()]
+        with time_limit(None if fast else LEGACY_TIMEOUT):
+            _, draws_dict = get_hand_and_draws(cards, fast)
+        got = [str(out) for out in draws_dict.get(draw, [])]
+        if got != expected:
+            failures.append({'cards': text, 'draw': draw.name, 'expected': expected, 'got': got})
+    return failures
+
+
+def exhaustive_cross_check(evaluate, size=5):
+    # all C(52, 5) = 2,598,960 five card hands by default
+    failures = 0
+    for spot in itertools.combinations(range(52), size):
+        if evaluate(spot) != reference_evaluate(spot):
+            failures += 1
+    return failures
+
+
+def time_hands(function, spots, timeout=None):
+    failures = 0
+    start = time.perf_counter()
+    for spot in spots:
+        try:
+            with time_limit(timeout):
+                function(spot)
+        except Exception:
+            failures += 1
+    elapsed = time.perf_counter() - start
+    return {'hands': len(spots), 'seconds': elapsed, 'hands_per_sec': len(spots) / elapsed if elapsed else 0.0,
+            'failures': failures}
+
+
+def time_legacy_phases(card_spots):
+    phase_seconds = Counter()
+    failures = 0
+    for cards in card_spots:
+        analysis = HandAnalysis()
+        analysis.cards.extend(cards)
+        try:
+            with time_limit(LEGACY_TIMEOUT):
+                for name, phase in LEGACY_PHASES:
+                    start = time.perf_counter()
+                    analysis = phase(analysis)
+                    phase_seconds[name] += time.perf_counter() - start
+        except Exception:
+            failures += 1
+    return {'hands': len(card_spots), 'failures': failures,
+            'us_per_hand': {name: phase_seconds[name] / len(card_spots) * 1e6 for name, _ in LEGACY_PHASES}}
+
+
+def time_odds(card_spots):
+    def exact(cards):
+        display_probabilities(None, BitDeck(SUITS, VALUES), None, cards=cards, show=False)
+
+    def outs(cards):
+        deck = BitDeck(SUITS, VALUES)
+        for card in cards:
+            deck.deal_id(card_to_int(card))
+        (hand_name, _, _), draws_dict = get_hand_and_draws(cards, fast=True)
+        display_probabilities(draws_dict, deck, hand_name, show=False)
+
+    return {'exact_river': time_hands(exact, card_spots), 'draws_outs': time_hands(outs, card_spots)}
+
+
+def time_decks(rounds, seed):
+    rng = random.Random(seed)
+
+    def list_deck(_):
+        deck = [int_to_card(c) for c in range(52)]
+        rng.shuffle(deck)
+        dealt = [deck.pop() for _ in range(6)]
+        return dealt
+
+    bit_deck = BitDeck(SUITS, VALUES, rng)
+
+    def bit_deck_round(_):
+        mark = bit_deck.mark()
+        dealt = [bit_deck.deal_random_id() for _ in range(6)]
+        bit_deck.count('A')
+        bit_deck.restore(mark)
+        return dealt
+
+    spots = range(rounds)
+    return {'list_shuffle_deal_6': time_hands(list_deck, spots), 'bitdeck_deal_6_restore': time_hands(bit_deck_round, spots)}
+
+
+def run(count=2000, seed=0, exhaustive=False):
+    corpora = default_corpora(count, seed)
+    report = {'seed': seed, 'corpora': {name: len(spots) for name, spots in corpora.items()}, 'engines': {},
+              'correctness': {}}
+
+    for engine_name, evaluate in engines().items():
+        report['engines'][engine_name] = {name: time_hands(evaluate, spots) for name, spots in corpora.items()}
+        report['correctness'][engine_name] = {name: cross_check(evaluate, spots) for name, spots in corpora.items()}
+        if exhaustive:
+            report['correctness'][engine_name]['exhaustive_5'] = exhaustive_cross_check(evaluate)
+
+    report['correctness']['draw_regressions'] = {'objects': check_draw_regressions(),
+                                                 'fast': check_draw_regressions(fast=True)}
+
+    six_card_spots = [[int_to_card(c) for c in spot] for spot in corpora['random_6']]
+    edge_card_spots = [[int_to_card(c) for c in spot] for spot in corpora['edge_cases']]
+    report['correctness']['get_hand_and_draws'] = {
+        'objects': hand_cross_check(lambda cards: get_hand_and_draws(cards)[0], six_card_spots + edge_card_spots,
+                                    timeout=LEGACY_TIMEOUT),
+        'fast': hand_cross_check(lambda cards: get_hand_and_draws(cards, fast=True)[0],
+                                 six_card_spots + edge_card_spots),
+    }
+    report['correctness']['fast_outs'] = outs_cross_check(six_card_spots + edge_card_spots)
+
+    report['get_hand_and_draws'] = {
+        'objects': time_hands(get_hand_and_draws, six_card_spots, LEGACY_TIMEOUT),
+        'fast': time_hands(lambda cards: get_hand_and_draws(cards, fast=True), six_card_spots),
+    }
+    report['legacy_phases'] = time_legacy_phases(six_card_spots)
+    report['odds'] = time_odds(six_card_spots)
+    report['decks'] = time_decks(count * 10, seed)
+    return report
+
+
+def correctness_failures(report) -> int:
+    correctness = report['correctness']
+    failures = sum(map(len, correctness['draw_regressions'].values())) + len(correctness['fast_outs'])
+    for engine_name in report['engines']:
+        for name, result in correctness[engine_name].items():
+            failures += result if name == 'exhaustive_5' else len(result)
+    for result in correctness['get_hand_and_draws'].values():
+        failures += result['wrong'] + result['errors'] + result['timeouts']
+    return failures
+
+
+def print_report(report):
+    for engine_name, corpora in report['engines'].items():
+        for name, timing in corpora.items():
+            failures = report['correctness'][engine_name][name]
+            print(f'{engine_name:<14} {name:<12} {timing["hands_per_sec"]:>12,.0f} hands/s  '
+                  f'{len(failures)} mismatches')
+        if 'exhaustive_5' in report['correctness'][engine_name]:
+            print(f'{engine_name:<14} exhaustive 5-card mismatches: {report["correctness"][engine_name]["exhaustive_5"]}')
+
+    for name, failures in report['correctness']['draw_regressions'].items():
+        for failure in failures:
+            print(f'draw regression    {name:<8} {failure["cards"]} {failure["draw"]}: expected {failure["expected"]}, '
+                  f'got {failure["got"]}')
+    for name, result in report['correctness']['get_hand_and_draws'].items():
+        print(f'get_hand_and_draws {name:<8} {result["wrong"]} wrong, {result["errors"]} raised, '
+              f'{result["timeouts"]} timed out of {result["hands"]} hands')
+    print(f'fast outs vs river_distribution: {len(report["correctness"]["fast_outs"])} mismatches')
+
+    for section in ('get_hand_and_draws', 'odds', 'decks'):
+        for name, timing in report[section].items():
+            print(f'{section:<18} {name:<24} {timing["hands_per_sec"]:>12,.0f} /s  {timing["failures"]} failures')
+
+    phases = report['legacy_phases']
+    print(f'legacy phases ({phases["failures"]} of {phases["hands"]} hands raised)')
+    for name, micros in phases['us_per_hand'].items():
+        print(f'  {name:<26} {micros:>8.2f} us/hand')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark and cross-check the turn_odds evaluators.')
+    parser.add_argument('--hands', type=int, default=2000, help='hands per random corpus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--exhaustive', action='store_true', help='also check every 5-card hand (slow)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    report = run(args.hands, args.seed, args.exhaustive)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    failures = correctness_failures(report)
+    if failures:
+        print(f'{failures} correctness failures', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()